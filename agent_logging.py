@@ -0,0 +1,64 @@
+# agent_logging.py
+import logging
+import sys
+from contextlib import contextmanager
+from logging.handlers import MemoryHandler
+
+import config
+
+_buffer_handler = None
+_console_handler = None
+
+class _ConsoleHandler(logging.StreamHandler):
+    """ StreamHandler whose per-record flush can be held back, so a block of lines goes out in one write. """
+    holding = False
+
+    def flush(self):
+        if not self.holding:
+            super().flush()
+
+def configure_logging():
+    """
+    Sets up the "agent", llm_handler and plan_cache loggers once. Records are kept in memory and
+    written to stdout in one go when a warning or error arrives, the buffer fills up, or flush_logs() is called.
+    """
+    global _buffer_handler, _console_handler
+    if _buffer_handler is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    _buffer_handler = MemoryHandler(capacity=100, flushLevel=logging.WARNING, target=stream_handler)
+    logging.getLogger().addHandler(_buffer_handler)
+    for name in ("agent", "llm_handler", "plan_cache"):
+        logging.getLogger(name).setLevel(config.LOG_LEVEL)
+
+    # User-facing messages: shown at INFO regardless of LOG_LEVEL, and not buffered with the step trace
+    _console_handler = _ConsoleHandler(sys.stdout)
+    _console_handler.setFormatter(logging.Formatter("%(message)s"))
+    console = logging.getLogger("agent.console")
+    console.addHandler(_console_handler)
+    console.setLevel(logging.INFO)
+    console.propagate = False
+
+def flush_logs():
+    if _buffer_handler is not None:
+        _buffer_handler.flush()
+
+@contextmanager
+def buffered_output():
+    """ Holds console output (and stdout line buffering) until the block ends, then writes it with one flush. """
+    if _console_handler is None:
+        yield
+        return
+    stream = _console_handler.stream
+    line_buffering = getattr(stream, "line_buffering", None)
+    if line_buffering:
+        stream.reconfigure(line_buffering=False)
+    _console_handler.holding = True
+    try:
+        yield
+    finally:
+        _console_handler.holding = False
+        if line_buffering:
+            stream.reconfigure(line_buffering=True)
+        _console_handler.flush()
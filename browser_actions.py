@@ -4,38 +4,223 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium.webdriver.remote.webelement import WebElement
+try:
+    from selenium.webdriver.remote.client_config import ClientConfig # Selenium >= 4.26
+except ImportError:
+    ClientConfig = None
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementNotInteractableException, StaleElementReferenceException
+from selenium.common.exceptions import JavascriptException, NoSuchWindowException
+import atexit
+import logging
 import time
-from typing import List, Dict, Union, Any,Optional
+from types import MappingProxyType
+from typing import List, Dict, Union, Any,Optional, Tuple
 
 import config # For SELENIUM_DRIVER_TYPE and SELENIUM_DRIVER_PATH
+from agent_logging import configure_logging, flush_logs
+
+logger = logging.getLogger("agent")
+
+_BY_STRATEGIES = MappingProxyType({
+    "css": By.CSS_SELECTOR,
+    "xpath": By.XPATH,
+    "id": By.ID,
+    "name": By.NAME,
+    "link_text": By.LINK_TEXT,
+    "partial_link_text": By.PARTIAL_LINK_TEXT,
+    "tag_name": By.TAG_NAME,
+})
+
+POLL_FREQUENCY = 0.2 # Seconds between WebDriverWait polls
+FAST_POLL_FREQUENCY = 0.05 # Seconds between in-page css/id lookups in _poll_for_element_js
+DOM_STABLE_POLL = 0.1 # Seconds between DOM size samples in _wait_dom_stable
+
+IN_VIEWPORT_JS = "const r = arguments[0].getBoundingClientRect(); return r.top >= 0 && r.bottom <= window.innerHeight;"
+
+# One round-trip replacements for is_displayed()+is_enabled() and .text/get_attribute chains
+INTERACTABLE_JS = "const e = arguments[0]; return !!(e.offsetWidth || e.offsetHeight || e.getClientRects().length) && !e.disabled;"
+ELEMENT_TEXT_JS = "const e = arguments[0]; return (e.innerText || e.value || e.textContent || '').trim();"
+
+# Selector types that can be resolved inside the page by FIND_ELEMENT_JS
+JS_SELECTOR_TYPES = ("css", "xpath", "id", "name", "tag_name")
+FIND_ELEMENT_JS = """
+function findElement(type, value) {
+    switch (type) {
+        case 'css': return document.querySelector(value);
+        case 'xpath': return document.evaluate(value, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        case 'id': return document.getElementById(value);
+        case 'name': return document.getElementsByName(value)[0] || null;
+        case 'tag_name': return document.getElementsByTagName(value)[0] || null;
+        default: return null;
+    }
+}
+"""
+# Sets every field through the native value setter (so framework-bound inputs notice) and returns the indexes of missing fields
+FILL_FORM_JS = FIND_ELEMENT_JS + """
+const missing = [];
+arguments[0].forEach((field, i) => {
+    const e = findElement(field.selector_type, field.selector_value);
+    if (!e) { missing.push(i); return; }
+    const descriptor = Object.getOwnPropertyDescriptor(Object.getPrototypeOf(e), 'value');
+    if (descriptor && descriptor.set) { descriptor.set.call(e, field.text); } else { e.value = field.text; }
+    e.dispatchEvent(new Event('input', {bubbles: true}));
+    e.dispatchEvent(new Event('change', {bubbles: true}));
+});
+return missing;
+"""
+# Polls for the element in the page, then scrolls and clicks it, all within one async script call.
+# Reports 'clicked', 'not_found' or 'not_interactable' (found but hidden/disabled until the timeout).
+# The window marker tells whether the document was replaced if the script never gets to report back.
+CLICK_ELEMENT_JS = FIND_ELEMENT_JS + """
+const [type, value, timeoutMs, done] = arguments;
+window.__agentClickDocument = true;
+const deadline = Date.now() + timeoutMs;
+let found = false;
+const attempt = () => {
+    const e = findElement(type, value);
+    found = found || !!e;
+    if (e && (e.offsetWidth || e.offsetHeight || e.getClientRects().length) && !e.disabled) {
+        clearInterval(timer);
+        e.scrollIntoView({block: 'center'});
+        e.click();
+        done('clicked');
+    } else if (Date.now() >= deadline) {
+        clearInterval(timer);
+        done(found ? 'not_interactable' : 'not_found');
+    }
+};
+const timer = setInterval(attempt, 50);
+attempt();
+"""
+# Reads several elements' text in one pass over the DOM; null for elements that are not there (yet)
+EXTRACT_TEXTS_JS = FIND_ELEMENT_JS + """
+return arguments[0].map(spec => {
+    const e = findElement(spec.selector_type, spec.selector_value);
+    return e ? (e.innerText || e.value || e.textContent || '').trim() : null;
+});
+"""
+
+# Actions that map directly onto a single BrowserAgent method and may appear inside a "batch"
+STEP_ACTIONS = ("navigate", "type", "click", "wait", "extract_text", "scroll", "fill_form")
+
+# action -> (required params, optional params). Checked once per plan by BrowserAgent.validate_plan.
+ACTION_PARAMS = {
+    "navigate": (("url",), ()),
+    "type": (("selector_type", "selector_value", "text"), ("enter_after",)),
+    "click": (("selector_type", "selector_value"), ()),
+    "wait": (("seconds",), ()),
+    "extract_text": (("selector_type", "selector_value", "variable_name"), ()),
+    "scroll": ((), ("direction", "pixels")),
+    "fill_form": (("fields",), ()),
+    "batch": (("steps",), ()),
+    "ask_user": (("question",), ()),
+    "error": ((), ("message",)),
+}
+INT_PARAMS = ("seconds", "pixels") # Coerced to int during validation
+STR_PARAMS = ("url", "selector_type", "selector_value", "text", "variable_name", "direction", "question") # Must be strings (a numeric "text" is coerced)
+FORM_FIELD_PARAMS = ("selector_type", "selector_value", "text")
 
 class BrowserAgent:
+    # Shared across instances when config.REUSE_BROWSER is on, so only the first agent pays the browser boot
+    _shared_driver: Optional[webdriver.Remote] = None
+    _chromedriver_service: Optional[ChromeService] = None
+
     def __init__(self):
         self.driver: Optional[webdriver.Remote] = None # Type hint for driver
         self.extracted_data: Dict[str, Any] = {} # To store data from extract_text actions
+        self._element_cache: Dict[Tuple[str, str], WebElement] = {} # Elements found by earlier steps on the current page
+        self._assets_blocked = False
+        # action -> (bound method, parameter names it takes from the step)
+        self._dispatch = {
+            "navigate": (self.navigate, ("url",)),
+            "type": (self.type_text, ("selector_type", "selector_value", "text", "enter_after")),
+            "click": (self.click_element, ("selector_type", "selector_value")),
+            "wait": (self.wait, ("seconds",)),
+            "extract_text": (self.extract_text, ("selector_type", "selector_value", "variable_name")),
+            "scroll": (self.scroll_window, ("direction", "pixels")),
+            "fill_form": (self.fill_form, ("fields",)),
+        }
         self._initialize_driver()
 
+    @classmethod
+    def _get_chromedriver_url(cls) -> str:
+        """ Starts one long-lived chromedriver process and returns its URL. """
+        if cls._chromedriver_service is None:
+            service = ChromeService(port=0) # 0 lets Selenium pick a free port, so other chromedrivers don't clash
+            service.start()
+            cls._chromedriver_service = service
+        return cls._chromedriver_service.service_url
+
+    @classmethod
+    def _shared_driver_alive(cls) -> bool:
+        if cls._shared_driver is None:
+            return False
+        try:
+            cls._shared_driver.current_url # Cheap round-trip that fails once the session is gone
+            return True
+        except Exception:
+            cls._shared_driver = None
+            return False
+
+    @classmethod
+    def shutdown_shared_driver(cls):
+        """ Really quits the shared browser and chromedriver. Registered with atexit. """
+        if cls._shared_driver is not None:
+            try:
+                cls._shared_driver.quit()
+            except Exception as e:
+                logger.error(f"Error during browser quit: {e}")
+            finally:
+                cls._shared_driver = None
+        if cls._chromedriver_service is not None:
+            try:
+                cls._chromedriver_service.stop()
+            except Exception as e:
+                logger.error(f"Error stopping chromedriver: {e}")
+            finally:
+                cls._chromedriver_service = None
+
     def _initialize_driver(self):
         driver_type = config.SELENIUM_DRIVER_TYPE.lower()
+        if config.REUSE_BROWSER and self._shared_driver_alive():
+            self.driver = BrowserAgent._shared_driver
+            if driver_type == "chrome" and config.BLOCK_HEAVY_ASSETS:
+                self.set_asset_blocking(True) # A previous agent may have left blocking off
+            logger.info(f"Reusing existing {config.SELENIUM_DRIVER_TYPE} browser.")
+            return
         # driver_path = getattr(config, 'SELENIUM_DRIVER_PATH', None) # Get path if defined
 
         try:
             if driver_type == "chrome":
                 options = webdriver.ChromeOptions()
-                # options.add_argument("--headless") # Uncomment for headless Browse
+                if config.HEADLESS:
+                    options.add_argument("--headless=new")
+                    options.add_argument("--window-size=1920,1080") # Headless ignores --start-maximized
                 options.add_argument("--start-maximized")
                 options.add_argument("--disable-gpu")
+                if config.BLOCK_HEAVY_ASSETS:
+                    options.add_argument("--blink-settings=imagesEnabled=false")
+                options.add_argument("--disable-extensions")
+                options.add_argument("--disable-background-networking")
+                options.add_argument("--disable-features=Translate,MediaRouter")
+                options.page_load_strategy = "eager" # driver.get returns at DOMContentLoaded
                 options.add_argument("--no-sandbox") # Often needed in containerized environments
                 options.add_argument("--disable-dev-shm-usage") # Overcome limited resource problems
                 # if driver_path:
                 #    service = webdriver.ChromeService(executable_path=driver_path)
                 #    self.driver = webdriver.Chrome(service=service, options=options)
                 # else:
-                self.driver = webdriver.Chrome(options=options)
+                if config.REUSE_BROWSER:
+                    url = self._get_chromedriver_url()
+                    self.driver = webdriver.Remote(command_executor=url, options=options, **self._remote_connection_args(url))
+                else:
+                    self.driver = webdriver.Chrome(options=options)
             elif driver_type == "firefox":
                 options = webdriver.FirefoxOptions()
-                # options.add_argument("--headless")
+                if config.HEADLESS:
+                    options.add_argument("--headless")
                 # if driver_path:
                 #    service = webdriver.FirefoxService(executable_path=driver_path)
                 #    self.driver = webdriver.Firefox(service=service, options=options)
@@ -44,65 +229,183 @@ class BrowserAgent:
             else:
                 raise ValueError(f"Unsupported driver type: {config.SELENIUM_DRIVER_TYPE}")
             
-            self.driver.implicitly_wait(5) # Default implicit wait
-            print(f"{config.SELENIUM_DRIVER_TYPE} browser initialized.")
+            self.disable_implicit_wait() # Explicit WebDriverWait drives all timing; misses fail fast
+            if driver_type == "chrome" and config.BLOCK_HEAVY_ASSETS:
+                self.set_asset_blocking(True)
+            if config.REUSE_BROWSER:
+                BrowserAgent._shared_driver = self.driver
+            logger.info(f"{config.SELENIUM_DRIVER_TYPE} browser initialized.")
         except Exception as e:
-            print(f"Error initializing WebDriver for {config.SELENIUM_DRIVER_TYPE}: {e}")
-            print("Ensure WebDriver is installed and in PATH, or SELENIUM_DRIVER_PATH is correctly set in config.py.")
+            logger.error(f"Error initializing WebDriver for {config.SELENIUM_DRIVER_TYPE}: {e}")
+            logger.error("Ensure WebDriver is installed and in PATH, or SELENIUM_DRIVER_PATH is correctly set in config.py.")
             raise
 
+    @staticmethod
+    def _remote_connection_args(url: str) -> Dict[str, Any]:
+        """
+        Keep-alive connection settings for webdriver.Remote, with a pool of config.WEBDRIVER_POOL_SIZE
+        connections. The pool size can only be set through ClientConfig; older Selenium keeps its default pool.
+        """
+        if ClientConfig is None:
+            return {"keep_alive": True}
+        # RemoteConnection reads the PoolManager arguments from this nested key
+        pool_args = {"init_args_for_pool_manager": {"maxsize": config.WEBDRIVER_POOL_SIZE}}
+        return {"client_config": ClientConfig(remote_server_addr=url, keep_alive=True, init_args_for_pool_manager=pool_args)}
+
+    def _execute_cdp(self, cmd: str, params: Dict[str, Any]) -> Any:
+        """ Chrome DevTools command that also works on a webdriver.Remote connected to chromedriver. """
+        if hasattr(self.driver, "execute_cdp_cmd"):
+            return self.driver.execute_cdp_cmd(cmd, params)
+        return self.driver.execute("executeCdpCommand", {"cmd": cmd, "params": params})["value"]
+
+    def set_asset_blocking(self, enabled: bool) -> bool:
+        """
+        Blocks (or unblocks) config.BLOCKED_URL_PATTERNS (images, fonts, trackers) so pages finish
+        loading sooner. Chrome only; returns False if blocking could not be changed.
+        """
+        if enabled == self._assets_blocked:
+            return True
+        try:
+            self._execute_cdp("Network.enable", {})
+            self._execute_cdp("Network.setBlockedURLs", {"urls": list(config.BLOCKED_URL_PATTERNS) if enabled else []})
+            self._assets_blocked = enabled
+            return True
+        except Exception as e:
+            logger.warning(f"Could not change asset blocking: {e}")
+            return False
+
+    def disable_implicit_wait(self):
+        self.driver.implicitly_wait(0)
+
     def _get_by_strategy(self, selector_type: str) -> By:
-        strategies = {
-            "css": By.CSS_SELECTOR,
-            "xpath": By.XPATH,
-            "id": By.ID,
-            "name": By.NAME,
-            "link_text": By.LINK_TEXT,
-            "partial_link_text": By.PARTIAL_LINK_TEXT,
-            "tag_name": By.TAG_NAME,
-        }
-        strategy = strategies.get(selector_type.lower())
-        if not strategy:
+        try:
+            return _BY_STRATEGIES[selector_type.lower()]
+        except KeyError:
             raise ValueError(f"Unsupported selector type: {selector_type}")
-        return strategy
 
     def _find_element(self, selector_type: str, selector_value: str, timeout: int = 10):
         by_strategy = self._get_by_strategy(selector_type)
-        return WebDriverWait(self.driver, timeout).until(
+        if by_strategy in (By.CSS_SELECTOR, By.ID):
+            return self._poll_for_element_js(selector_type.lower(), selector_value, timeout)
+        return WebDriverWait(self.driver, timeout, poll_frequency=POLL_FREQUENCY).until(
             EC.presence_of_element_located((by_strategy, selector_value))
         )
 
+    @staticmethod
+    def _is_cacheable(selector_type: str, selector_value: str) -> bool:
+        # Positional XPath predicates can point at a different node after any DOM change
+        return not (selector_type.lower() == "xpath" and ("position()" in selector_value or "last()" in selector_value))
+
+    def _find_cached(self, selector_type: str, selector_value: str, timeout: int = 10):
+        """ Like _find_element, but reuses the element from an earlier step if it is still attached. """
+        key = (selector_type.lower(), selector_value)
+        element = self._element_cache.get(key)
+        if element is not None:
+            try:
+                element.is_displayed() # Raises once the element has been detached from the page
+                return element
+            except StaleElementReferenceException:
+                del self._element_cache[key]
+        element = self._find_element(selector_type, selector_value, timeout)
+        if self._is_cacheable(selector_type, selector_value):
+            self._element_cache[key] = element
+        return element
+
+    def _poll_for_element_js(self, selector_type: str, selector_value: str, timeout: float):
+        """
+        Resolves a css/id selector in the page with one script call per attempt, retrying every
+        FAST_POLL_FREQUENCY seconds. Raises TimeoutException like WebDriverWait would.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            element = self.driver.execute_script(FIND_ELEMENT_JS + "return findElement(arguments[0], arguments[1]);", selector_type, selector_value)
+            if element is not None:
+                return element
+            if time.monotonic() >= deadline:
+                raise TimeoutException(f"Element ('{selector_type}'='{selector_value}') not found within {timeout}s")
+            time.sleep(FAST_POLL_FREQUENCY)
+
     def _find_clickable_element(self, selector_type: str, selector_value: str, timeout: int = 10):
         by_strategy = self._get_by_strategy(selector_type)
-        return WebDriverWait(self.driver, timeout).until(
+        return WebDriverWait(self.driver, timeout, poll_frequency=POLL_FREQUENCY).until(
             EC.element_to_be_clickable((by_strategy, selector_value))
         )
 
-    def navigate(self, url: str) -> bool:
-        print(f"Navigating to: {url}")
+    def _wait_in_viewport(self, element, timeout: float = 1) -> bool:
+        """ Waits for a scrolled element to settle inside the viewport instead of sleeping a fixed time. """
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=DOM_STABLE_POLL).until(
+                lambda d: d.execute_script(IN_VIEWPORT_JS, element)
+            )
+            return True
+        except TimeoutException:
+            return False
+
+    def _wait_dom_stable(self, timeout: float = 2.0) -> bool:
+        """
+        Waits until the document is loaded and the number of DOM nodes stops changing
+        between two consecutive samples. Returns False if the page did not settle in time.
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            while self.driver.execute_script("return document.readyState") != "complete":
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(DOM_STABLE_POLL)
+            previous_count = self.driver.execute_script("return document.querySelectorAll('*').length")
+            while time.monotonic() < deadline:
+                time.sleep(DOM_STABLE_POLL)
+                count = self.driver.execute_script("return document.querySelectorAll('*').length")
+                if count == previous_count:
+                    return True
+                previous_count = count
+        except Exception as e:
+            logger.warning(f"Could not check DOM stability: {e}")
+        return False
+
+    def navigate(self, url: str, wait_for: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Loads url. If wait_for ({"selector_type", "selector_value"}) is given, returns as soon as
+        that element is present instead of waiting for the whole page to finish loading.
+        """
+        logger.info(f"Navigating to: {url}")
+        self._element_cache.clear()
         try:
             self.driver.get(url)
-            WebDriverWait(self.driver, 15).until(lambda d: d.execute_script('return document.readyState') == 'complete')
+            if wait_for:
+                try:
+                    by_strategy = self._get_by_strategy(wait_for["selector_type"])
+                    WebDriverWait(self.driver, 15, poll_frequency=POLL_FREQUENCY).until(
+                        EC.presence_of_element_located((by_strategy, wait_for["selector_value"]))
+                    )
+                    return True
+                except TimeoutException:
+                    # The page had 15 s already; the next step reports the missing element itself
+                    logger.warning(f"Element for the next step did not appear after navigating to {url}.")
+                    return True
+                except ValueError:
+                    logger.warning(f"Cannot wait for the next step's element after navigating to {url}. Waiting for page load instead.")
+            WebDriverWait(self.driver, 15, poll_frequency=POLL_FREQUENCY).until(lambda d: d.execute_script('return document.readyState') == 'complete')
             return True
         except TimeoutException:
-            print(f"Timeout while navigating to {url}. Page might not have fully loaded.")
+            logger.error(f"Timeout while navigating to {url}. Page might not have fully loaded.")
             return False # Indicate partial success or allow retry
         except Exception as e:
-            print(f"Error navigating to {url}: {e}")
+            logger.error(f"Error navigating to {url}: {e}")
             return False
 
     def type_text(self, selector_type: str, selector_value: str, text: str, enter_after: bool = False) -> bool:
         action_str = f"Typing '{text}' into element ('{selector_type}'='{selector_value}')"
-        print(action_str)
+        logger.info(action_str)
         try:
-            element = self._find_element(selector_type, selector_value)
+            element = self._find_cached(selector_type, selector_value)
             # Ensure element is interactable (e.g. not hidden, enabled)
-            if not element.is_displayed() or not element.is_enabled():
-                print(f"Warning: Element for typing is not displayed or enabled.")
+            if not self.driver.execute_script(INTERACTABLE_JS, element):
+                logger.warning("Element for typing is not displayed or enabled.")
                 # Attempt to scroll to it
                 self.driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                time.sleep(0.5) # Give time for scroll
-                if not element.is_displayed() or not element.is_enabled(): # Check again
+                self._wait_in_viewport(element) # Give time for scroll
+                if not self.driver.execute_script(INTERACTABLE_JS, element): # Check again
                     raise ElementNotInteractableException("Element still not interactable after scroll")
 
             element.clear()
@@ -111,74 +414,132 @@ class BrowserAgent:
                 element.send_keys(Keys.RETURN)
             return True
         except (TimeoutException, NoSuchElementException):
-            print(f"Error: Element not found for typing - {action_str}")
+            logger.error(f"Error: Element not found for typing - {action_str}")
             return False
         except ElementNotInteractableException as e:
-            print(f"Error: Element not interactable for typing - {action_str}. Details: {e}")
+            logger.error(f"Error: Element not interactable for typing - {action_str}. Details: {e}")
             return False
         except Exception as e:
-            print(f"Error during type: {e} - {action_str}")
+            logger.error(f"Error during type: {e} - {action_str}")
+            return False
+
+    def _js_click(self, selector_type: str, selector_value: str, timeout_ms: int = 5000) -> Optional[str]:
+        """
+        Finds, scrolls to and clicks the element in a single round-trip.
+        Returns the script's status, or None if the in-page path could not be used.
+        """
+        if selector_type.lower() not in JS_SELECTOR_TYPES:
+            return None
+        try:
+            return self.driver.execute_async_script(CLICK_ELEMENT_JS, selector_type.lower(), selector_value, timeout_ms)
+        except NoSuchWindowException:
+            return "clicked" # The click closed the window
+        except JavascriptException as e:
+            if self._document_replaced():
+                return "clicked" # The click navigated away before the script could report back
+            logger.warning(f"In-page click failed, falling back to WebDriver click. Details: {e}")
+            return None
+        except Exception as e:
+            logger.warning(f"In-page click failed, falling back to WebDriver click. Details: {e}")
+            return None
+
+    def _document_replaced(self) -> bool:
+        """ True if the page CLICK_ELEMENT_JS ran in has been replaced by a new document since. """
+        try:
+            return not self.driver.execute_script("return window.__agentClickDocument === true;")
+        except NoSuchWindowException:
+            return True
+        except Exception:
             return False
 
     def click_element(self, selector_type: str, selector_value: str) -> bool:
         action_str = f"Clicking element ('{selector_type}'='{selector_value}')"
-        print(action_str)
+        logger.info(action_str)
+        status = self._js_click(selector_type, selector_value)
+        if status == "clicked":
+            return True
+        if status == "not_found":
+            logger.error(f"Error: Element not found or not clickable - {action_str}")
+            return False
         try:
             element = self._find_clickable_element(selector_type, selector_value)
             # Attempt to scroll into view if direct click fails or for robustness
             try:
                 self.driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", element)
-                time.sleep(0.5) # Wait for scroll to settle
+                self._wait_in_viewport(element) # Wait for scroll to settle
             except Exception:
                 pass # If scroll fails, try clicking anyway
 
             element.click()
             return True
         except (TimeoutException, NoSuchElementException):
-            print(f"Error: Element not found or not clickable - {action_str}")
+            logger.error(f"Error: Element not found or not clickable - {action_str}")
             return False
         except ElementNotInteractableException as e:
-            print(f"Error: Element not interactable for click - {action_str}. Trying JS click. Details: {e}")
+            logger.error(f"Error: Element not interactable for click - {action_str}. Trying JS click. Details: {e}")
             # Fallback to JavaScript click if standard click fails
             try:
                 element_to_js_click = self._find_element(selector_type, selector_value) # Re-find without clickability check
                 self.driver.execute_script("arguments[0].click();", element_to_js_click)
                 return True
             except Exception as js_e:
-                print(f"Error: JavaScript click also failed for - {action_str}. Details: {js_e}")
+                logger.error(f"Error: JavaScript click also failed for - {action_str}. Details: {js_e}")
                 return False
         except StaleElementReferenceException:
-            print(f"Error: Stale element reference for - {action_str}. Element might have changed. Consider re-finding.")
+            self._element_cache.clear()
+            logger.error(f"Error: Stale element reference for - {action_str}. Element might have changed. Consider re-finding.")
             return False # Could trigger a re-plan with LLM
         except Exception as e:
-            print(f"Error during click: {e} - {action_str}")
+            logger.error(f"Error during click: {e} - {action_str}")
             return False
 
     def wait(self, seconds: int) -> bool:
-        print(f"Waiting for {seconds} seconds...")
+        logger.info(f"Waiting for {seconds} seconds...")
         time.sleep(seconds)
         return True
 
     def extract_text(self, selector_type: str, selector_value: str, variable_name: str) -> bool:
         action_str = f"Extracting text from ('{selector_type}'='{selector_value}') into var '{variable_name}'"
-        print(action_str)
+        logger.info(action_str)
         try:
-            element = self._find_element(selector_type, selector_value)
-            text_content = element.text or element.get_attribute("value") or element.get_attribute("innerText")
-            self.extracted_data[variable_name] = text_content.strip() if text_content else ""
-            print(f"Extracted to '{variable_name}': '{self.extracted_data[variable_name][:100]}...'") # Preview
+            element = self._find_cached(selector_type, selector_value)
+            text_content = self.driver.execute_script(ELEMENT_TEXT_JS, element)
+            self.extracted_data[variable_name] = text_content or ""
+            logger.info(f"Extracted to '{variable_name}': '{self.extracted_data[variable_name][:100]}...'") # Preview
             return True
         except (TimeoutException, NoSuchElementException):
-            print(f"Error: Element not found for text extraction - {action_str}")
+            logger.error(f"Error: Element not found for text extraction - {action_str}")
             self.extracted_data[variable_name] = None
             return False
         except Exception as e:
-            print(f"Error during text extraction: {e} - {action_str}")
+            logger.error(f"Error during text extraction: {e} - {action_str}")
             self.extracted_data[variable_name] = None
             return False
 
+    def _read_texts(self, steps: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Reads the elements of several extract_text steps with a single script call. None for elements
+        that are not present (yet); those steps fall back to extract_text, which waits for them.
+        """
+        logger.info(f"Reading text from {len(steps)} elements in one pass")
+        specs = [{"selector_type": step["selector_type"].lower(), "selector_value": step["selector_value"]} for step in steps]
+        try:
+            return self.driver.execute_script(EXTRACT_TEXTS_JS, specs)
+        except Exception as e:
+            logger.warning(f"Combined text extraction failed, extracting one by one. Details: {e}")
+            return [None] * len(steps)
+
+    @staticmethod
+    def _extraction_run_end(plan: List[Dict[str, Any]], start: int) -> int:
+        """ Index just past the run of consecutive extract_text steps (with in-page selectors) starting at start. """
+        end = start
+        while end < len(plan) and plan[end]["action"] == "extract_text" and plan[end]["selector_type"].lower() in JS_SELECTOR_TYPES:
+            end += 1
+        return end
+
     def scroll_window(self, direction: str = "down", pixels: int = 0) -> bool: # Pixels optional
-        print(f"Scrolling window {direction}" + (f" by {pixels} pixels" if direction in ["up", "down"] and pixels else ""))
+        logger.info(f"Scrolling window {direction}" + (f" by {pixels} pixels" if direction in ["up", "down"] and pixels else ""))
+        self._element_cache.clear()
         try:
             if direction.lower() == "down":
                 self.driver.execute_script(f"window.scrollBy(0, {pixels if pixels else 'window.innerHeight'});")
@@ -189,12 +550,30 @@ class BrowserAgent:
             elif direction.lower() == "to_top":
                 self.driver.execute_script("window.scrollTo(0, 0);")
             else:
-                print(f"Invalid scroll direction: {direction}")
+                logger.error(f"Invalid scroll direction: {direction}")
                 return False
-            time.sleep(0.5) # Allow scroll to complete
             return True
         except Exception as e:
-            print(f"Error during scroll: {e}")
+            logger.error(f"Error during scroll: {e}")
+            return False
+
+    def fill_form(self, fields: List[Dict[str, Any]]) -> bool:
+        logger.info(f"Filling {len(fields)} form field(s)")
+        specs = []
+        for field in fields:
+            selector_type = field["selector_type"].lower()
+            if selector_type not in JS_SELECTOR_TYPES:
+                raise ValueError(f"Unsupported selector type for fill_form: {field['selector_type']}")
+            specs.append({"selector_type": selector_type, "selector_value": field["selector_value"], "text": field["text"]})
+        try:
+            missing = self.driver.execute_script(FILL_FORM_JS, specs)
+            if missing:
+                for index in missing:
+                    logger.error(f"Error: Element not found for form field ('{specs[index]['selector_type']}'='{specs[index]['selector_value']}')")
+                return False
+            return True
+        except Exception as e:
+            logger.error(f"Error during form fill: {e}")
             return False
 
     def ask_user(self, question: str) -> str:
@@ -202,60 +581,244 @@ class BrowserAgent:
         return input("Your response: ")
 
     def close_browser(self):
-        if self.driver:
-            print("Closing browser...")
+        if not self.driver:
+            return
+        self._element_cache.clear()
+        if config.REUSE_BROWSER and not config.FORCE_BROWSER_QUIT and self.driver is BrowserAgent._shared_driver:
+            # Keep the process alive for the next BrowserAgent; just drop this session's state
+            logger.info("Resetting browser for reuse...")
             try:
-                self.driver.quit()
+                self.driver.delete_all_cookies()
+                self.driver.get("about:blank")
             except Exception as e:
-                print(f"Error during browser quit: {e}")
+                logger.error(f"Error during browser reset: {e}")
             finally:
                 self.driver = None
+            return
+        logger.info("Closing browser...")
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.error(f"Error during browser quit: {e}")
+        finally:
+            if self.driver is BrowserAgent._shared_driver:
+                BrowserAgent._shared_driver = None
+            self.driver = None
+
+    @staticmethod
+    def _successor_selector(next_step: Optional[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+        """ Returns the selector the step after a navigate needs, so navigate can wait for just that element. """
+        if not isinstance(next_step, dict) or next_step.get("action") not in ("type", "click", "extract_text"):
+            return None
+        if not next_step.get("selector_type") or not next_step.get("selector_value"):
+            return None
+        return {"selector_type": next_step["selector_type"], "selector_value": next_step["selector_value"]}
+
+    @staticmethod
+    def _check_strings(params: Dict[str, Any], action: str):
+        """
+        Coerces a numeric "text" (e.g. a zip code) to str in place, then raises ValueError if a
+        STR_PARAMS value is not a string or names an unknown selector type.
+        """
+        if isinstance(params.get("text"), (int, float)) and not isinstance(params["text"], bool):
+            params["text"] = str(params["text"])
+        for name in STR_PARAMS:
+            if name in params and params[name] is not None and not isinstance(params[name], str):
+                raise ValueError(f"'{name}' must be a string for action '{action}', got {params[name]!r}.")
+        selector_type = params.get("selector_type")
+        if selector_type is not None and selector_type.lower() not in _BY_STRATEGIES:
+            raise ValueError(f"Unsupported selector type '{selector_type}' for action '{action}'.")
+
+    @classmethod
+    def validate_step(cls, step: Any, allow_nested: bool = True) -> Dict[str, Any]:
+        """
+        Checks one step against ACTION_PARAMS and returns a copy with INT_PARAMS coerced to int.
+        Raises ValueError describing the first problem found.
+        """
+        if not isinstance(step, dict):
+            raise ValueError(f"Step must be an object, got {type(step).__name__}.")
+        action = step.get("action")
+        if action not in ACTION_PARAMS:
+            raise ValueError(f"Unknown action '{action}'.")
+        required, _ = ACTION_PARAMS[action]
+        missing = [name for name in required if step.get(name) is None]
+        if missing:
+            raise ValueError(f"Missing parameter(s) {', '.join(missing)} for action '{action}'.")
+        validated = dict(step)
+        cls._check_strings(validated, action)
+        for name in INT_PARAMS:
+            if name in validated:
+                try:
+                    validated[name] = int(validated[name])
+                except (TypeError, ValueError):
+                    raise ValueError(f"'{name}' must be an integer for action '{action}', got {validated[name]!r}.")
+        if action == "fill_form":
+            if not isinstance(validated["fields"], list) or not validated["fields"]:
+                raise ValueError("'fields' must be a non-empty list for fill_form action.")
+            if any(not isinstance(field, dict) or any(name not in field for name in FORM_FIELD_PARAMS) for field in validated["fields"]):
+                raise ValueError(f"Each fill_form field needs {', '.join(FORM_FIELD_PARAMS)}.")
+            validated["fields"] = [dict(field) for field in validated["fields"]]
+            for field in validated["fields"]:
+                cls._check_strings(field, action)
+        elif action == "batch":
+            if not allow_nested:
+                raise ValueError("Batches cannot be nested.")
+            if not isinstance(validated["steps"], list) or not validated["steps"]:
+                raise ValueError("'steps' must be a non-empty list for batch action.")
+            validated["steps"] = [cls.validate_step(sub_step, allow_nested=False) for sub_step in validated["steps"]]
+            for sub_step in validated["steps"]:
+                if sub_step["action"] not in STEP_ACTIONS:
+                    raise ValueError(f"Action '{sub_step['action']}' is not allowed inside a batch.")
+        return validated
+
+    @classmethod
+    def validate_plan(cls, plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """ Validates every step up front (no browser needed). Returns the normalized plan or raises ValueError. """
+        validated = []
+        for i, step in enumerate(plan):
+            try:
+                validated.append(cls.validate_step(step))
+            except ValueError as e:
+                raise ValueError(f"Step {i+1}: {e}")
+        return validated
+
+    @staticmethod
+    def _step_size(step: Any) -> int:
+        """ Number of actions a step stands for: a batch counts as its sub-steps. """
+        if isinstance(step, dict) and step.get("action") == "batch" and isinstance(step.get("steps"), list):
+            return len(step["steps"])
+        return 1
+
+    @classmethod
+    def count_steps(cls, plan: List[Dict[str, Any]]) -> int:
+        """ Length of the plan with batches flattened, for comparing against config.MAX_STEPS_PER_PLAN. """
+        return sum(cls._step_size(step) for step in plan)
+
+    @classmethod
+    def truncate_plan(cls, plan: List[Dict[str, Any]], max_steps: int) -> List[Dict[str, Any]]:
+        """ Keeps the first max_steps actions, cutting inside a batch if one straddles the limit. """
+        truncated = []
+        remaining = max_steps
+        for step in plan:
+            if remaining <= 0:
+                break
+            size = cls._step_size(step)
+            if size > remaining:
+                step = dict(step, steps=step["steps"][:remaining])
+                size = remaining
+            truncated.append(step)
+            remaining -= size
+        return truncated
+
+    @staticmethod
+    def extracted_names(plan: List[Dict[str, Any]]) -> List[str]:
+        """ Keys execute_plan adds to extracted_data when the whole plan runs (extract_text variables and ask_user answers). """
+        names = []
+        for i, step in enumerate(plan):
+            if not isinstance(step, dict):
+                continue
+            sub_steps = step.get("steps") if step.get("action") == "batch" and isinstance(step.get("steps"), list) else [step]
+            names.extend(sub_step["variable_name"] for sub_step in sub_steps
+                         if isinstance(sub_step, dict) and sub_step.get("action") == "extract_text" and sub_step.get("variable_name"))
+            if step.get("action") == "ask_user":
+                names.append(f"user_response_to_{i+1}")
+        return names
+
+    def prepare_plan(self, plan: List[Dict[str, Any]], prefetch: bool = True) -> List[Dict[str, Any]]:
+        """
+        Validates the plan and, if prefetch is on and the plan starts with a navigate, loads that page
+        ahead of time. Returns the steps still left to execute. Meant to run in the background while
+        the user is asked to confirm the plan. Raises ValueError for invalid plans.
+        """
+        validated = self.validate_plan(plan)
+        if prefetch and validated and validated[0]["action"] == "navigate":
+            next_step = validated[1] if len(validated) > 1 else None
+            if self._dispatch_step("navigate", validated[0], next_step):
+                if not self._successor_selector(next_step):
+                    self._wait_dom_stable()
+                return validated[1:]
+        return validated
+
+    def _dispatch_step(self, action: str, step: Dict[str, Any], next_step: Optional[Dict[str, Any]] = None) -> bool:
+        """ Runs one of the STEP_ACTIONS on an already validated step. """
+        fn, arg_names = self._dispatch[action]
+        kwargs = {name: step[name] for name in arg_names if name in step}
+        if action == "navigate":
+            kwargs["wait_for"] = self._successor_selector(next_step)
+        return fn(**kwargs)
+
+    def _run_batch(self, steps: List[Dict[str, Any]]) -> bool:
+        """
+        Runs several already validated steps back to back with no settling between them,
+        then waits for the page once at the end. Stops at the first failing sub-step.
+        """
+        failed_step = None
+        for j, sub_step in enumerate(steps):
+            sub_action = sub_step["action"]
+            logger.info(f"  Batch step {j+1}/{len(steps)}: {sub_action}")
+            next_sub_step = steps[j + 1] if j + 1 < len(steps) else None
+            if not self._dispatch_step(sub_action, sub_step, next_sub_step):
+                failed_step = j + 1
+                break
+        self._wait_dom_stable()
+        if failed_step is not None:
+            logger.error(f"Batch stopped at step {failed_step}/{len(steps)}.")
+            return False
+        return True
 
     def execute_plan(self, plan: List[Dict[str, Any]], current_instruction: str) -> (bool, Optional[str]):
         """ Executes a plan of actions. Returns (overall_success, error_message_if_any) """
         if not self.driver:
-            print("Browser not initialized. Cannot execute plan.")
+            logger.error("Browser not initialized. Cannot execute plan.")
             return False, "Browser not initialized."
 
         executed_successfully = True
         error_message_for_llm = None
+        try:
+            plan = self.validate_plan(plan)
+        except ValueError as e:
+            logger.error(f"Invalid plan: {e}")
+            return False, f"Invalid plan: {e}"
 
+        prefetched_texts: Dict[int, str] = {} # Step index -> text read ahead for a run of extract_text steps
+        run_end = 0
         for i, step in enumerate(plan):
             action = step.get("action")
-            print(f"\nExecuting Step {i+1}/{len(plan)}: {action} with params {step}")
+            next_step = plan[i + 1] if i + 1 < len(plan) else None
+            logger.info(f"Executing Step {i+1}/{len(plan)}: {action} with params {step}")
             step_success = False
             try:
-                if action == "navigate":
-                    url = step.get("url")
-                    if not url: raise ValueError("'url' missing for navigate action.")
-                    step_success = self.navigate(url)
-                elif action == "type":
-                    step_success = self.type_text(step["selector_type"], step["selector_value"], step["text"], step.get("enter_after", False))
-                elif action == "click":
-                    step_success = self.click_element(step["selector_type"], step["selector_value"])
-                elif action == "wait":
-                    step_success = self.wait(int(step["seconds"]))
-                elif action == "extract_text":
-                    step_success = self.extract_text(step["selector_type"], step["selector_value"], step["variable_name"])
-                elif action == "scroll":
-                    step_success = self.scroll_window(step.get("direction", "down"), int(step.get("pixels", 0)))
+                if action == "extract_text" and i >= run_end:
+                    run_end = self._extraction_run_end(plan, i)
+                    if run_end - i > 1:
+                        for j, text_content in enumerate(self._read_texts(plan[i:run_end]), i):
+                            if text_content is not None:
+                                prefetched_texts[j] = text_content
+                if i in prefetched_texts:
+                    self.extracted_data[step["variable_name"]] = prefetched_texts.pop(i)
+                    logger.info(f"Extracted to '{step['variable_name']}': '{self.extracted_data[step['variable_name']][:100]}...'") # Preview
+                    step_success = True
+                elif action in self._dispatch:
+                    step_success = self._dispatch_step(action, step, next_step)
+                elif action == "batch":
+                    step_success = self._run_batch(step["steps"])
                 elif action == "ask_user":
                     user_response = self.ask_user(step["question"])
                     # This response might need to be fed back to the LLM for a new plan
                     # For now, we'll just store it and consider the step successful if asked.
                     self.extracted_data[f"user_response_to_{i+1}"] = user_response
-                    print(f"User responded: {user_response}")
+                    logger.info(f"User responded: {user_response}")
                     step_success = True # Or potentially break and re-plan with this info.
                     # For a more advanced agent, an "ask_user" action might imply the current plan stops,
                     # and a new plan is generated using the user's answer.
                     # For simplicity here, we'll continue if there are more steps, assuming they don't depend on the answer.
                 elif action == "error": # Error reported by LLM in the plan itself
-                    print(f"Error in plan from LLM: {step.get('message')}")
+                    logger.error(f"Error in plan from LLM: {step.get('message')}")
                     executed_successfully = False
                     error_message_for_llm = step.get('message')
                     break # Stop execution
                 else:
-                    print(f"Unknown action: {action}")
+                    logger.error(f"Unknown action: {action}")
                     executed_successfully = False
                     error_message_for_llm = f"Unknown action '{action}' in plan."
                     break
@@ -263,38 +826,45 @@ class BrowserAgent:
                 if not step_success:
                     executed_successfully = False
                     error_message_for_llm = f"Action '{action}' failed. Params: {step}."
-                    print(f"Step failed: {error_message_for_llm}")
+                    logger.error(f"Step failed: {error_message_for_llm}")
                     # Advanced: Could try to take a screenshot here.
                     # self.driver.save_screenshot(f"error_step_{i+1}.png")
                     break # Stop on first failure for now
 
-                time.sleep(1) # Small delay between actions for observation and page stability
+                # Let the page settle before the next step. A navigate that was given the next step's selector
+                # already waited for that element (or for the full load), so settling again would only add delay.
+                if action in ("click", "scroll") or (action == "navigate" and not self._successor_selector(next_step)):
+                    self._wait_dom_stable()
 
             except KeyError as e:
-                print(f"Execution Error: Missing parameter for action '{action}': {e}")
+                logger.error(f"Execution Error: Missing parameter for action '{action}': {e}")
                 executed_successfully = False
                 error_message_for_llm = f"Missing parameter for action '{action}': {e}."
                 break
             except ValueError as e: # E.g. bad selector type, non-integer for wait
-                print(f"Execution Error: Invalid parameter value for action '{action}': {e}")
+                logger.error(f"Execution Error: Invalid parameter value for action '{action}': {e}")
                 executed_successfully = False
                 error_message_for_llm = f"Invalid parameter for action '{action}': {e}."
                 break
             except Exception as e:
-                print(f"Execution Error: An unexpected error occurred during action '{action}': {e}")
+                logger.error(f"Execution Error: An unexpected error occurred during action '{action}': {e}")
                 executed_successfully = False
                 error_message_for_llm = f"Unexpected error during action '{action}': {e}."
                 break
         
         if executed_successfully:
-            print("\nPlan execution finished successfully.")
+            logger.info("Plan execution finished successfully.")
         else:
-            print(f"\nPlan execution failed or was interrupted. Error: {error_message_for_llm}")
+            logger.error(f"Plan execution failed or was interrupted. Error: {error_message_for_llm}")
         
-        print("Current extracted data:", self.extracted_data)
+        logger.info(f"Extracted variables: {list(self.extracted_data)}")
+        flush_logs() # Write out this plan's buffered step trace
         return executed_successfully, error_message_for_llm
 
+atexit.register(BrowserAgent.shutdown_shared_driver)
+
 if __name__ == '__main__':
+    configure_logging()
     agent = None
     try:
         agent = BrowserAgent()
@@ -19,14 +19,30 @@ FAMOUS_SITES = {
     # Add more sites
 }
 
+# Lookup tables built once at import. Keys are lowercase with spaces removed.
+_NORMALIZED = {k.replace(" ", "").lower(): v for k, v in FAMOUS_SITES.items()}
+_ALIASES = {
+    "gh": "github",
+    "yt": "youtube",
+    "fb": "facebook",
+    "wiki": "wikipedia",
+    "hf": "huggingface",
+    "bbc": "bbcnews",
+    "newyorktimes": "nytimes",
+    "nyt": "nytimes",
+}
+
 def get_url_for_site(site_name: str) -> str | None:
     """
     Returns the URL for a common site name, if found.
-    Performs a case-insensitive lookup.
+    Performs a case-insensitive lookup that ignores spaces and accepts common aliases.
     """
-    return FAMOUS_SITES.get(site_name.lower())
+    key = site_name.replace(" ", "").lower()
+    return _NORMALIZED.get(_ALIASES.get(key, key))
 
 if __name__ == '__main__':
     print(get_url_for_site("Google"))
     print(get_url_for_site("GooGLe"))
-    print(get_url_for_site("non existent"))
\ No newline at end of file
+    print(get_url_for_site("non existent"))
+    print(get_url_for_site("Hugging Face"))
+    print(get_url_for_site("yt"))
\ No newline at end of file
@@ -12,8 +12,17 @@ LLM_PROVIDER = "gemini"  # or "groq"
 # For Gemini (via Google AI Studio) - check their latest free tier model, e.g., 'gemini-1.5-flash-latest'
 GEMINI_MODEL_NAME = "gemini-1.5-flash-latest"
 
-# For Llama on Groq (check Groq console for available free models, e.g., 'llama3-8b-8192')
-GROQ_MODEL_NAME = "llama3-8b-8192" # Example, check Groq for current free models
+# For Llama on Groq (check Groq console for available free models, e.g., 'llama-3.1-8b-instant')
+GROQ_MODEL_NAME = "llama-3.1-8b-instant" # Example, check Groq for current free models
+
+# Tiered planning: plans come from the fast model; a plan that fails is re-planned once with the strong model
+PLANNER_MODEL_FAST = {"gemini": GEMINI_MODEL_NAME, "groq": GROQ_MODEL_NAME}
+PLANNER_MODEL_STRONG = {"gemini": "gemini-1.5-pro-latest", "groq": "llama-3.3-70b-versatile"}
+
+# Sampling for plan generation (applied to both providers)
+LLM_TEMPERATURE = 0 # Deterministic output, so the plan caches see identical plans for identical requests
+LLM_MAX_TOKENS = None # Output cap; None derives it from MAX_STEPS_PER_PLAN below
+GROQ_SERVICE_TIER = None # e.g. "performance" if your Groq account has that tier; None sends no service_tier
 
 # API Keys (loaded from environment variables)
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -25,7 +34,37 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 # and its path is in your system's PATH, or specify it directly.
 SELENIUM_DRIVER_TYPE = "Chrome"  # Or "Firefox", etc.
 # SELENIUM_DRIVER_PATH = "/path/to/your/webdriver/chromedriver" # Optional, if not in PATH
+WEBDRIVER_POOL_SIZE = 16 # Keep-alive HTTP connections to the shared chromedriver (REUSE_BROWSER, Selenium >= 4.26)
+HEADLESS = True # Set to False to watch the browser while debugging
+BLOCK_HEAVY_ASSETS = True # Chrome only: skip loading images, fonts and trackers (see BLOCKED_URL_PATTERNS)
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg",
+    "*.woff*", "*.ttf",
+    "*google-analytics*", "*doubleclick*", "*facebook.net*",
+]
+REUSE_BROWSER = False # Keep one browser (and chromedriver service) alive across BrowserAgent instances; only helps if several agents are created
+FORCE_BROWSER_QUIT = os.getenv("AGENT_FORCE_BROWSER_QUIT", "").lower() in ("1", "true", "yes") # Quit instead of reset on close_browser()
 
 # --- Agent Configuration ---
+VERBOSE_PLAN_PRINT = True # Print each plan before asking for confirmation
+LOG_LEVEL = "WARNING" # Set to "INFO" to see a trace of every executed step
 MAX_RETRIES_LLM = 2 # Max retries if LLM output is not parsable
-MAX_STEPS_PER_PLAN = 15 # Safety limit for number of steps in a plan
\ No newline at end of file
+MAX_STEPS_PER_PLAN = 15 # Safety limit for number of steps in a plan
+if LLM_MAX_TOKENS is None:
+    LLM_MAX_TOKENS = min(2048, MAX_STEPS_PER_PLAN * 120) # ~120 tokens per JSON step
+PREFETCH_FIRST_PAGE = False # Load a plan's first URL while waiting for confirmation (the browser navigates even if the plan is then declined)
+PAUSE_AFTER_EXEC = False # Wait for Enter after each executed plan (always skipped when stdin is not a terminal)
+
+# --- Plan Cache ---
+PLAN_HISTORY_PATH = "~/.agent_cache.zst" # Exact-repeat plan memo, persisted between sessions (zstd-compressed if zstandard is installed)
+PLAN_HISTORY_SIZE = 256 # Max instructions remembered (least recently used are dropped)
+PLAN_CACHE_ENABLED = True # Reuse plans of previously successful, similar instructions instead of calling the LLM
+PLAN_CACHE_PATH = ".plan_cache.sqlite"
+PLAN_CACHE_THRESHOLD = 0.90 # Minimum cosine similarity between instructions for a cache hit
+PLAN_CACHE_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2" # Used if sentence-transformers is installed
+GEMINI_EMBEDDING_MODEL = "models/text-embedding-004" # Fallback embedding backend
+
+# --- Speculative Planning ---
+SPECULATIVE_PLANNING = False # Plan likely follow-up instructions in the background while the user types (extra LLM calls)
+SPECULATION_TOP_K = 2 # How many predicted follow-ups to plan after each successful turn
+SPECULATION_TTL_SECONDS = 300 # Discard speculative plans older than this
@@ -1,187 +1,293 @@
 # llm_handler.py
 import google.generativeai as genai
-from groq import Groq
+from groq import Groq, AsyncGroq
+import httpx
+import asyncio
+import functools
+import io
 import json
+import logging
+import re
 import time
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Callable
 from typing import Union
 import os
+try:
+    import orjson # Optional: 2-3x faster plan parsing
+    _json_loads = orjson.loads # orjson.JSONDecodeError subclasses json.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
 
 import config
-import common_sites 
 from common_sites import get_url_for_site
 
+logger = logging.getLogger(__name__) # Attempt details show at INFO; the final error plan is reported by the caller
+
 # --- Configure LLM Providers ---
 if config.LLM_PROVIDER == "gemini":
     if not config.GOOGLE_API_KEY:
         raise ValueError("GOOGLE_API_KEY not found in .env file. Please add it.")
     genai.configure(api_key=config.GOOGLE_API_KEY)
-    gemini_model = genai.GenerativeModel(config.GEMINI_MODEL_NAME)
-    print(f"Using Gemini model: {config.GEMINI_MODEL_NAME}")
 elif config.LLM_PROVIDER == "groq":
     if not config.GROQ_API_KEY:
         raise ValueError("GROQ_API_KEY not found in .env file. Please add it.")
-    groq_client = Groq(api_key=config.GROQ_API_KEY)
-    print(f"Using Groq with Llama model: {config.GROQ_MODEL_NAME}")
+    # One pooled keep-alive connection per process, so only the first request pays the TLS handshake
+    _http_limits = httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60)
+    try:
+        import h2 # noqa: F401 -- httpx needs it for HTTP/2
+        _use_http2 = True
+    except ImportError:
+        _use_http2 = False
+    groq_client = Groq(api_key=config.GROQ_API_KEY, http_client=httpx.Client(http2=_use_http2, timeout=30, limits=_http_limits))
+    async_groq_client = AsyncGroq(api_key=config.GROQ_API_KEY, http_client=httpx.AsyncClient(http2=_use_http2, timeout=30, limits=_http_limits))
 else:
     raise ValueError(f"Unsupported LLM_PROVIDER: {config.LLM_PROVIDER}. Choose 'gemini' or 'groq'.")
 
 
-def get_system_prompt() -> str:
+
+# Schema + rules only: this prefix is paid on every call, so keep it short. Identical across calls
+# (no date, no history) so providers can reuse their prompt cache for it.
+STATIC_SYSTEM_PROMPT = (
+    "Convert the user's web task into a JSON list of browser steps. Output ONLY the JSON list.\n"
+    "Steps (sel = \"selector_type\": css|xpath|id|name|link_text|partial_link_text|tag_name, \"selector_value\"):\n"
+    '{"action":"navigate","url":"https://..."}\n'
+    '{"action":"type",sel,"text":"...","enter_after":true}\n'
+    '{"action":"click",sel}\n'
+    '{"action":"wait","seconds":2}\n'
+    '{"action":"extract_text",sel,"variable_name":"..."}\n'
+    '{"action":"scroll","direction":"down|up|to_bottom|to_top","pixels":500}\n'
+    '{"action":"fill_form","fields":[{sel,"text":"..."}]}\n'
+    '{"action":"batch","steps":[...]} (steps that need no page settle in between)\n'
+    '{"action":"ask_user","question":"..."} (if ambiguous)\n'
+    f"Use robust selectors and canonical URLs. At most {config.MAX_STEPS_PER_PLAN} steps.\n"
+    'If unclear, impossible or harmful: [{"action":"error","message":"..."}]'
+)
+
+# Leading ```json / trailing ``` fences, stripped in a single pass
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.DOTALL)
+
+# "Go to Google", "open youtube", "visit Hugging Face." ...
+_LOCAL_NAVIGATION_RE = re.compile(r"^\s*(?:go to|open|navigate to|visit)\s+(.+?)[\s.!]*$")
+
+def _try_local_plan(instruction: str) -> Optional[List[Dict[str, str]]]:
     """
-    Returns the system prompt for the LLM to guide its behavior.
+    Builds the plan without the LLM when the instruction is just "go to <famous site>".
+    Returns None if the instruction needs real planning.
     """
-    # ISO 8601 format for current date - LLMs might not use it directly, but good practice for context
-    current_date_iso = time.strftime("%Y-%m-%d")
-
-    prompt = f"""
-    You are an expert web automation assistant. Your task is to convert a user's natural language instruction
-    into a precise, step-by-step JSON plan for browser automation. Today's date is {current_date_iso}.
-
-    The plan should be a JSON list of action objects. Each action object must have an "action" key and
-    other keys specific to that action.
-
-    Supported Actions and their JSON structure:
-    1.  "navigate": {{
-            "action": "navigate",
-            "url": "<full_URL_string>"
-        }}
-        - If the user mentions a famous website (e.g., "Google", "YouTube", "Wikipedia", "GitHub"),
-          use its canonical URL. You have access to a list of common sites.
-          Example: "Go to Google" -> "url": "https://www.google.com"
-
-    2.  "type": {{
-            "action": "type",
-            "selector_type": "<css|xpath|id|name|link_text|partial_link_text|tag_name>",
-            "selector_value": "<selector_string>",
-            "text": "<text_to_type_string>",
-            "enter_after": <true|false> (optional, defaults to false. If true, press Enter key after typing)
-        }}
-        - Choose the most robust selector_type and selector_value possible.
-        - For search bars, "enter_after" should often be true.
-
-    3.  "click": {{
-            "action": "click",
-            "selector_type": "<css|xpath|id|name|link_text|partial_link_text|tag_name>",
-            "selector_value": "<selector_string>"
-        }}
-
-    4.  "wait": {{
-            "action": "wait",
-            "seconds": <integer_seconds_to_wait>
-        }}
-        - Use this for explicit waits if necessary, e.g., after a page load or dynamic content update.
-
-    5.  "extract_text": {{
-            "action": "extract_text",
-            "selector_type": "<css|xpath|id|name|tag_name>",
-            "selector_value": "<selector_string>",
-            "variable_name": "<string_name_to_store_extracted_text>"
-        }}
-        - The extracted text will be stored and can potentially be used in later steps or shown to the user.
-
-    6.  "scroll": {{
-            "action": "scroll",
-            "direction": "<down|up|to_bottom|to_top>",
-            "pixels": <integer_pixels_to_scroll> (only if direction is 'up' or 'down')
-        }}
-
-    7.  "ask_user": {{
-            "action": "ask_user",
-            "question": "<string_question_for_the_user>"
-        }}
-        - Use this if the instruction is ambiguous or requires user input to proceed.
-
-    Output ONLY the JSON plan as a single JSON list. Do NOT include any other text, greetings, or explanations outside the JSON structure.
-    Be concise and accurate. Ensure the JSON is valid.
-    Limit the number of steps to a reasonable amount, typically less than {config.MAX_STEPS_PER_PLAN}. If the task is too complex, break it down or use "ask_user".
-
-    Consider the following common site mappings if a direct URL isn't given:
-    {json.dumps(common_sites.FAMOUS_SITES, indent=2)}
-
-    If the user instruction is too vague, impossible, or potentially harmful, respond with:
-    [{{"action": "error", "message": "Instruction is unclear or cannot be safely executed."}}]
+    match = _LOCAL_NAVIGATION_RE.match(instruction.lower())
+    if not match:
+        return None
+    url = get_url_for_site(match.group(1))
+    if not url:
+        return None
+    return [{"action": "navigate", "url": url}]
+
+def _build_prompts(instruction: str, previous_actions: Optional[List[Dict]] = None, error_context: Optional[str] = None) -> tuple:
+    """
+    Returns (memory_prompt, user_prompt) for an instruction. Everything that changes between calls
+    goes in memory_prompt, sent after STATIC_SYSTEM_PROMPT, so the static prefix stays cacheable.
+    History is only sent when re-planning after an error, and then only the step that failed
+    (the last of previous_actions), never the whole plan.
     """
-    return prompt
+    memory_prompt = f"Date: {time.strftime('%Y-%m-%d')}"
+    if error_context:
+        if previous_actions:
+            memory_prompt += f"\nFailed step: {json.dumps(previous_actions[-1], separators=(',', ':'))}"
+        memory_prompt += f"\nError: {error_context}"
+    return memory_prompt, f"Task: {instruction}"
+
+def _model_name(tier: str) -> str:
+    """ Model for a planning tier ("fast" or "strong") of the configured provider. """
+    models = config.PLANNER_MODEL_STRONG if tier == "strong" else config.PLANNER_MODEL_FAST
+    return models[config.LLM_PROVIDER]
+
+@functools.lru_cache(maxsize=None)
+def _gemini_model(tier: str = "fast") -> "genai.GenerativeModel":
+    generation_config = {"temperature": config.LLM_TEMPERATURE, "max_output_tokens": config.LLM_MAX_TOKENS}
+    # The static prompt is the model's system instruction, so it is the same leading prefix on every request.
+    # (Explicit cached_content needs a prefix of at least 32k tokens, far more than this prompt.)
+    return genai.GenerativeModel(_model_name(tier), generation_config=generation_config, system_instruction=STATIC_SYSTEM_PROMPT)
+
+def _groq_request(memory_prompt: str, user_prompt: str, tier: str = "fast") -> Dict[str, Any]:
+    """ Keyword arguments for chat.completions.create, shared by the sync, async and streaming calls. """
+    request = dict(
+        messages=[
+            {"role": "system", "content": STATIC_SYSTEM_PROMPT}, # Bit-identical on every call: cached prefix
+            {"role": "system", "content": memory_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        model=_model_name(tier),
+        temperature=config.LLM_TEMPERATURE, # Deterministic plans, so identical requests give cacheable answers
+        max_tokens=config.LLM_MAX_TOKENS,
+        top_p=1,
+        stop=None, # Let the model decide when to stop, or use "]}" if it helps
+        # response_format={"type": "json_object"}, # If supported and helps
+    )
+    if config.GROQ_SERVICE_TIER:
+        request["extra_body"] = {"service_tier": config.GROQ_SERVICE_TIER} # Not a named argument in older SDKs
+    return request
 
-def generate_plan_from_instruction(instruction: str, previous_actions: Optional[List[Dict]] = None, error_context: Optional[str] = None) -> List[Dict[str, Union[str, int, bool]]]:
+def _groq_completion(memory_prompt: str, user_prompt: str, stream: bool = False, tier: str = "fast"):
+    return groq_client.chat.completions.create(**_groq_request(memory_prompt, user_prompt, tier), stream=stream)
+
+def _gemini_error_plan(response) -> Optional[List[Dict[str, str]]]:
+    """ Returns an error plan if Gemini blocked the prompt or answered with nothing, else None. """
+    # Check for safety ratings or blocks if using Gemini
+    if not response.candidates or not response.candidates[0].content.parts:
+         # Handle cases where the response might be blocked due to safety settings
+        if response.prompt_feedback and response.prompt_feedback.block_reason:
+            logger.info(f"Gemini API: Content blocked due to {response.prompt_feedback.block_reason}")
+            return [{"action": "error", "message": f"LLM generation blocked: {response.prompt_feedback.block_reason}"}]
+        else: # Other empty response case
+            logger.info("Gemini API: Received an empty response.")
+            return [{"action": "error", "message": "LLM generation failed (empty response)."}]
+    return None
+
+def _parse_plan(raw_llm_output: Optional[str]) -> List[Dict[str, Any]]:
+    """ Cleans and parses raw LLM output into a plan. Raises json.JSONDecodeError / ValueError. """
+    if not raw_llm_output:
+        raise ValueError("LLM returned empty content.")
+
+    # Clean the output: LLMs sometimes add markdown ```json ... ```
+    cleaned_output = _FENCE_RE.sub("", raw_llm_output)
+
+    # Attempt to parse the JSON
+    plan = _json_loads(cleaned_output)
+    if not isinstance(plan, list):
+        raise ValueError("LLM output is not a JSON list.")
+    # Validate basic structure of each step (presence of 'action' key)
+    for step in plan:
+        if not isinstance(step, dict) or "action" not in step:
+            raise ValueError("Invalid step structure in LLM output: missing 'action' key.")
+    return plan
+
+def _attempt_failed(e: Exception, attempt: int, raw_llm_output: Optional[str]) -> Optional[List[Dict[str, str]]]:
+    """ Reports a failed attempt. Returns the error plan to give up with after the last attempt, else None. """
+    if isinstance(e, json.JSONDecodeError):
+        logger.info(f"LLM Error: Failed to parse JSON output (Attempt {attempt + 1}/{config.MAX_RETRIES_LLM}). Error: {e}")
+        logger.debug(f"LLM Raw Output:\n---\n{raw_llm_output}\n---")
+        if attempt == config.MAX_RETRIES_LLM - 1:
+            return [{"action": "error", "message": "Failed to parse LLM JSON output after multiple retries."}]
+    else:
+        logger.info(f"LLM Error: An unexpected error occurred (Attempt {attempt + 1}/{config.MAX_RETRIES_LLM}). Error: {e}")
+        if attempt == config.MAX_RETRIES_LLM - 1:
+            return [{"action": "error", "message": f"An unexpected error occurred with the LLM: {e}"}]
+    return None
+
+def _warm_up_connection():
+    """ Sends a minimal request so the connection to the provider is open before the first real call. """
+    try:
+        if config.LLM_PROVIDER == "gemini":
+            _gemini_model().generate_content("ping", generation_config={"max_output_tokens": 1})
+        elif config.LLM_PROVIDER == "groq":
+            groq_client.chat.completions.create(messages=[{"role": "user", "content": "ping"}], model=_model_name("fast"), max_tokens=1)
+    except Exception as e:
+        logger.warning(f"LLM warm-up failed (the first request will be slower): {e}")
+
+def generate_plan_from_instruction(instruction: str, previous_actions: Optional[List[Dict]] = None, error_context: Optional[str] = None,
+                                   on_token: Optional[Callable[[str], None]] = None, warmup: bool = False, tier: str = "fast",
+                                   on_retry: Optional[Callable[[], None]] = None) -> List[Dict[str, Union[str, int, bool]]]:
     """
     Uses the configured LLM to convert a natural language instruction into a structured plan.
     Can take previous actions and error context for more advanced re-planning (future enhancement).
+    If on_token is given, the response is streamed and on_token is called with each text fragment
+    as it arrives (e.g. to show the plan while it is being generated). on_retry is called before a failed
+    attempt is retried, so a caller showing the streamed text knows that text is void.
+    With warmup=True, only opens the connection to the provider with a tiny request and returns [].
+    tier picks config.PLANNER_MODEL_FAST (default) or config.PLANNER_MODEL_STRONG, e.g. for re-planning after a failure.
     """
-    full_prompt = f"{get_system_prompt()}\n\nUser Instruction: \"{instruction}\""
-    if previous_actions: # For potential future re-planning
-        full_prompt += f"\n\nPrevious Actions History (for context, if relevant for re-planning):\n{json.dumps(previous_actions, indent=2)}"
-    if error_context: # For potential future re-planning
-        full_prompt += f"\n\nError Context from previous attempt: {error_context}"
-    full_prompt += "\n\nJSON Plan:"
+    if warmup:
+        _warm_up_connection()
+        return []
+    if not previous_actions and not error_context:
+        local_plan = _try_local_plan(instruction)
+        if local_plan:
+            return local_plan
+
+    memory_prompt, user_prompt = _build_prompts(instruction, previous_actions, error_context)
+    gemini_prompt = [memory_prompt, user_prompt] # Gemini gets the static part as the model's system instruction
 
     raw_llm_output = None
     for attempt in range(config.MAX_RETRIES_LLM):
         try:
-            if config.LLM_PROVIDER == "gemini":
-                response = gemini_model.generate_content(full_prompt)
-                # Check for safety ratings or blocks if using Gemini
-                if not response.candidates or not response.candidates[0].content.parts:
-                     # Handle cases where the response might be blocked due to safety settings
-                    if response.prompt_feedback and response.prompt_feedback.block_reason:
-                        print(f"Gemini API: Content blocked due to {response.prompt_feedback.block_reason}")
-                        return [{"action": "error", "message": f"LLM generation blocked: {response.prompt_feedback.block_reason}"}]
-                    else: # Other empty response case
-                        print("Gemini API: Received an empty response.")
-                        return [{"action": "error", "message": "LLM generation failed (empty response)."}]
+            if on_token is not None:
+                raw_llm_output = _collect_stream(memory_prompt, user_prompt, on_token, tier)
+            elif config.LLM_PROVIDER == "gemini":
+                response = _gemini_model(tier).generate_content(gemini_prompt)
+                error_plan = _gemini_error_plan(response)
+                if error_plan:
+                    return error_plan
                 raw_llm_output = response.text
             elif config.LLM_PROVIDER == "groq":
-                chat_completion = groq_client.chat.completions.create(
-                    messages=[
-                        {"role": "system", "content": get_system_prompt()}, # Groq prefers system prompt separately
-                        {"role": "user", "content": f"User Instruction: \"{instruction}\"\nJSON Plan:"}
-                    ],
-                    model=config.GROQ_MODEL_NAME,
-                    temperature=0.2, # Lower temperature for more deterministic plan generation
-                    max_tokens=1024,
-                    top_p=1,
-                    stop=None, # Let the model decide when to stop, or use "]}" if it helps
-                    # response_format={"type": "json_object"}, # If supported and helps
-                )
+                chat_completion = _groq_completion(memory_prompt, user_prompt, tier=tier)
                 raw_llm_output = chat_completion.choices[0].message.content
-
-            if not raw_llm_output:
-                raise ValueError("LLM returned empty content.")
-
-            # Clean the output: LLMs sometimes add markdown ```json ... ```
-            cleaned_output = raw_llm_output.strip()
-            if cleaned_output.startswith("```json"):
-                cleaned_output = cleaned_output[7:]
-            if cleaned_output.endswith("```"):
-                cleaned_output = cleaned_output[:-3]
-            cleaned_output = cleaned_output.strip()
-            
-            # Attempt to parse the JSON
-            plan = json.loads(cleaned_output)
-            if not isinstance(plan, list):
-                raise ValueError("LLM output is not a JSON list.")
-            # Validate basic structure of each step (presence of 'action' key)
-            for step in plan:
-                if not isinstance(step, dict) or "action" not in step:
-                    raise ValueError("Invalid step structure in LLM output: missing 'action' key.")
-            return plan
-
-        except json.JSONDecodeError as e:
-            print(f"LLM Error: Failed to parse JSON output (Attempt {attempt + 1}/{config.MAX_RETRIES_LLM}). Error: {e}")
-            print(f"LLM Raw Output:\n---\n{raw_llm_output}\n---")
-            if attempt == config.MAX_RETRIES_LLM - 1:
-                return [{"action": "error", "message": "Failed to parse LLM JSON output after multiple retries."}]
+            return _parse_plan(raw_llm_output)
+        except Exception as e:
+            error_plan = _attempt_failed(e, attempt, raw_llm_output)
+            if error_plan:
+                return error_plan
+            if on_retry is not None:
+                on_retry()
             time.sleep(1) # Wait before retrying
+
+    return [{"action": "error", "message": "LLM failed to generate a valid plan."}]
+
+async def generate_plan_from_instruction_async(instruction: str, previous_actions: Optional[List[Dict]] = None, error_context: Optional[str] = None,
+                                               tier: str = "fast") -> List[Dict[str, Union[str, int, bool]]]:
+    """
+    Async version of generate_plan_from_instruction using the providers' async clients, so the
+    LLM request can overlap with other work (e.g. the browser executing the previous plan).
+    """
+    if not previous_actions and not error_context:
+        local_plan = _try_local_plan(instruction)
+        if local_plan:
+            return local_plan
+
+    memory_prompt, user_prompt = _build_prompts(instruction, previous_actions, error_context)
+    gemini_prompt = [memory_prompt, user_prompt]
+
+    raw_llm_output = None
+    for attempt in range(config.MAX_RETRIES_LLM):
+        try:
+            if config.LLM_PROVIDER == "gemini":
+                response = await _gemini_model(tier).generate_content_async(gemini_prompt)
+                error_plan = _gemini_error_plan(response)
+                if error_plan:
+                    return error_plan
+                raw_llm_output = response.text
+            elif config.LLM_PROVIDER == "groq":
+                chat_completion = await async_groq_client.chat.completions.create(**_groq_request(memory_prompt, user_prompt, tier))
+                raw_llm_output = chat_completion.choices[0].message.content
+            return _parse_plan(raw_llm_output)
         except Exception as e:
-            print(f"LLM Error: An unexpected error occurred (Attempt {attempt + 1}/{config.MAX_RETRIES_LLM}). Error: {e}")
-            if attempt == config.MAX_RETRIES_LLM - 1:
-                return [{"action": "error", "message": f"An unexpected error occurred with the LLM: {e}"}]
-            time.sleep(1)
+            error_plan = _attempt_failed(e, attempt, raw_llm_output)
+            if error_plan:
+                return error_plan
+            await asyncio.sleep(1)
 
     return [{"action": "error", "message": "LLM failed to generate a valid plan."}]
 
 
+def _stream_llm_text(memory_prompt: str, user_prompt: str, tier: str = "fast") -> Iterator[str]:
+    if config.LLM_PROVIDER == "gemini":
+        for chunk in _gemini_model(tier).generate_content([memory_prompt, user_prompt], stream=True):
+            if chunk.text:
+                yield chunk.text
+    elif config.LLM_PROVIDER == "groq":
+        for chunk in _groq_completion(memory_prompt, user_prompt, stream=True, tier=tier):
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+
+def _collect_stream(memory_prompt: str, user_prompt: str, on_token: Callable[[str], None], tier: str = "fast") -> str:
+    """ Streams the completion, passing each fragment to on_token, and returns the full text. """
+    buffer = io.StringIO()
+    for text in _stream_llm_text(memory_prompt, user_prompt, tier):
+        on_token(text)
+        buffer.write(text)
+    return buffer.getvalue()
+
+
 if __name__ == '__main__':
     # Test the LLM plan generation
     # Ensure your .env file is populated with API keys
@@ -1,100 +1,403 @@
 # main.py
+import asyncio
+import concurrent.futures
+import itertools
 import json
+import logging
+import queue
+import sys
+import threading
+import time
+import traceback
+try:
+    import readline # noqa: F401 -- line editing and history for the prompt
+except ImportError:
+    pass
+try:
+    import orjson # Optional: faster plan pretty-printing
+except ImportError:
+    orjson = None
 import config
-from llm_handler import generate_plan_from_instruction
+from llm_handler import generate_plan_from_instruction, generate_plan_from_instruction_async
 from browser_actions import BrowserAgent
+from agent_logging import buffered_output, configure_logging
+from plan_cache import PlanCache, PlanHistory, SpeculativePlanner
+
+console = logging.getLogger("agent.console") # User-facing output, see agent_logging.configure_logging
+
+_YES = frozenset({"yes", "y"})
+
+def _confirm(question: str) -> bool:
+    """ Asks a yes/no question; anything but yes/y counts as no. """
+    return input(f"{question} (yes/no): ").strip().lower() in _YES
+
+def _dumps(plan) -> str:
+    """ Pretty-prints a plan, with orjson when it is installed. """
+    if orjson is not None:
+        return orjson.dumps(plan, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(plan, indent=2)
+
+def _checked_plan(plan, max_steps: int, name: str = "Plan"):
+    """
+    Checks every plan gets before it is shown: its structure, LLM error plans and the step limit
+    (offering to run only the first max_steps steps). Returns the plan to show and run, which is a
+    truncated copy if it was too long, or None if it must not run.
+    """
+    if not plan or not isinstance(plan, list) or not all(isinstance(step, dict) and step.get("action") for step in plan):
+        console.error("Invalid or empty plan received from LLM. Please try rephrasing.")
+        return None
+    if plan[0].get("action") == "error": # Checked first so error plans are never pretty-printed
+        console.error(f"Cannot execute plan due to LLM error: {plan[0].get('message')}")
+        return None
+    n_steps = BrowserAgent.count_steps(plan) # Steps inside a batch count individually
+    if n_steps > max_steps: # Checked before printing, so rejected plans are never serialized
+        console.warning(f"Warning: {name} has {n_steps} steps, more than the configured maximum ({max_steps}).")
+        if not _confirm(f"Continue with only the first {max_steps} steps?"):
+            console.info("Plan aborted by user due to length.")
+            return None
+        return BrowserAgent.truncate_plan(plan, max_steps)
+    return plan
+
+class _StreamPrinter:
+    """
+    Shows a spinner until the first token arrives, then echoes the tokens as they stream in.
+    retried is set if the LLM call started over, i.e. the echoed text is not the final plan.
+    """
+
+    def __init__(self, message: str):
+        self.received_tokens = False
+        self.retried = False
+        self._message = message
+        self._first_token = threading.Event()
+        self._spinner = threading.Thread(target=self._spin, daemon=True)
+        self._spinner.start()
+
+    def _spin(self):
+        for frame in itertools.cycle("|/-\\"):
+            sys.stdout.write(f"\r{self._message} {frame}")
+            sys.stdout.flush()
+            if self._first_token.wait(0.1):
+                break
+        sys.stdout.write("\r" + " " * (len(self._message) + 2) + "\r")
+
+    def stop(self):
+        if not self._first_token.is_set():
+            self._first_token.set()
+            self._spinner.join()
+
+    def __call__(self, token: str):
+        self.stop()
+        self.received_tokens = True
+        sys.stdout.write(token)
+        sys.stdout.flush()
+
+    def retry(self):
+        if self.received_tokens:
+            sys.stdout.write("\n(invalid output, retrying...)\n")
+            sys.stdout.flush()
+        self.retried = True
+
+class _InputReader:
+    """
+    Reads prompted lines on a daemon thread, so the main loop can keep doing background work
+    (e.g. collecting speculative plans) while the user types.
+    """
+
+    def __init__(self):
+        self._prompts = queue.Queue()
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read_lines, daemon=True).start()
+
+    def _read_lines(self):
+        while True:
+            prompt = self._prompts.get()
+            try:
+                self._lines.put(input(prompt))
+            except EOFError:
+                self._lines.put(None)
+                return
+
+    def read(self, prompt: str, on_idle=None) -> str:
+        """
+        Like input(prompt), calling on_idle between polls. Polls every 5 ms right after the prompt
+        appears and backs off to 200 ms after a second without input. Raises EOFError at end of input.
+        """
+        self._prompts.put(prompt)
+        timeout = 0.005
+        idle_since = time.monotonic()
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                if on_idle:
+                    on_idle()
+                if time.monotonic() - idle_since > 1.0:
+                    timeout = 0.2
+                continue
+            if line is None:
+                raise EOFError
+            return line
 
 def check_api_keys():
     if config.LLM_PROVIDER == "gemini" and not config.GOOGLE_API_KEY:
-        print("ERROR: GOOGLE_API_KEY is not set in your .env file or environment variables.")
-        print("Please get a key from Google AI Studio and set it.")
+        console.error("ERROR: GOOGLE_API_KEY is not set in your .env file or environment variables.")
+        console.error("Please get a key from Google AI Studio and set it.")
         return False
     if config.LLM_PROVIDER == "groq" and not config.GROQ_API_KEY:
-        print("ERROR: GROQ_API_KEY is not set in your .env file or environment variables.")
-        print("Please get a key from Groq Console and set it.")
+        console.error("ERROR: GROQ_API_KEY is not set in your .env file or environment variables.")
+        console.error("Please get a key from Groq Console and set it.")
         return False
     return True
 
+# One event loop for the whole session: the async LLM clients keep pooled connections bound to the
+# loop they were opened on, so a fresh asyncio.run() per batch would strand them
+_event_loop = None
+
+def _run_async(coroutine):
+    global _event_loop
+    if _event_loop is None:
+        _event_loop = asyncio.new_event_loop()
+    return _event_loop.run_until_complete(coroutine)
+
+async def plan_instructions_concurrently(instructions: list) -> list:
+    """ Plans several instructions at once, so the LLM wait is the slowest plan rather than the sum. """
+    return await asyncio.gather(*(generate_plan_from_instruction_async(instruction) for instruction in instructions))
+
+def run_instruction_batch(browser_agent: BrowserAgent, instructions: list, plan_history: PlanHistory, plan_cache: PlanCache = None,
+                          max_steps: int = config.MAX_STEPS_PER_PLAN):
+    """
+    Handles ';;'-separated input: plans all instructions concurrently, shows the plans in order,
+    asks for a single confirmation and executes them one after another, stopping at the first failure.
+    Remembered plans are looked up in order, each in the context (extracted variable names) the plans
+    before it leave behind. After the first instruction that needs the LLM that context is unknown,
+    so the remaining instructions are planned by the LLM too.
+    """
+    plans = []
+    cached_plans = {} # Index -> plan served by plan_cache, evicted again if it fails
+    context_keys = tuple(browser_agent.extracted_data)
+    for index, instruction in enumerate(instructions):
+        plan = plan_history.get(instruction, context_keys)
+        if not plan and plan_cache and (plan := plan_cache.lookup(instruction, context_keys)):
+            cached_plans[index] = plan
+        if not plan:
+            break
+        plans.append(plan)
+        context_keys = tuple(dict.fromkeys(context_keys + tuple(BrowserAgent.extracted_names(plan))))
+    pending = instructions[len(plans):]
+    if pending:
+        console.info(f"\n🤖 Thinking... Planning {len(pending)} instructions concurrently...")
+        plans.extend(_run_async(plan_instructions_concurrently(pending)))
+
+    for index, plan in enumerate(plans):
+        plans[index] = _checked_plan(plan, max_steps, name=f"Plan {index + 1}")
+        if plans[index] is None:
+            console.error(f"Cannot execute: no valid plan for instruction {index + 1}. Please try rephrasing.")
+            return
+
+    with buffered_output():
+        for number, (instruction, plan) in enumerate(zip(instructions, plans), 1):
+            console.info(f"\n📄 Plan {number}/{len(plans)}: {instruction}")
+            if config.VERBOSE_PLAN_PRINT:
+                console.info(_dumps(plan))
+
+    if not _confirm(f"Do you want to execute these {len(plans)} plans?"):
+        console.info("Plans aborted by user.")
+        return
+    for index, (instruction, plan) in enumerate(zip(instructions, plans)):
+        console.info(f"\n🚀 Executing plan {index + 1}/{len(plans)}: {instruction}")
+        context_keys = tuple(browser_agent.extracted_data)
+        success, error_message = browser_agent.execute_plan(plan, instruction)
+        if not success:
+            if index in cached_plans:
+                plan_cache.evict(cached_plans[index]) # Don't serve a plan that no longer works
+            console.error(f"❌ Plan execution failed. Error: {error_message}")
+            if index + 1 < len(plans):
+                console.warning(f"Skipping the remaining {len(plans) - index - 1} plan(s).")
+            return
+        plan_history.put(instruction, plan, context_keys)
+        if plan_cache:
+            plan_cache.put(instruction, plan, context_keys)
+    with buffered_output():
+        console.info("✅ All plans executed successfully.")
+        for name, value in browser_agent.extracted_data.items():
+            console.info(f"   {name}: {str(value)[:100]}")
+
 def main():
-    print("Welcome to the Advanced AI Web Automation Agent!")
-    print(f"Using LLM Provider: {config.LLM_PROVIDER.upper()}")
-    print(f"LLM Model (Gemini): {config.GEMINI_MODEL_NAME}")
-    print(f"LLM Model (Groq): {config.GROQ_MODEL_NAME}")
-    print("---")
+    configure_logging()
+    if "--quiet" in sys.argv[1:]:
+        console.setLevel(logging.WARNING) # Only warnings and errors; prompts still appear
+    console.info("Welcome to the Advanced AI Web Automation Agent!")
+    console.info(f"Using LLM Provider: {config.LLM_PROVIDER.upper()}")
+    console.info(f"LLM Models (Gemini): {config.PLANNER_MODEL_FAST['gemini']} (fast), {config.PLANNER_MODEL_STRONG['gemini']} (strong)")
+    console.info(f"LLM Models (Groq): {config.PLANNER_MODEL_FAST['groq']} (fast), {config.PLANNER_MODEL_STRONG['groq']} (strong)")
+    console.info("---")
 
     if not check_api_keys():
         return
 
+    # Looked up once instead of on every turn
+    max_steps = config.MAX_STEPS_PER_PLAN
+    verbose_plan_print = config.VERBOSE_PLAN_PRINT
+    prefetch_first_page = config.PREFETCH_FIRST_PAGE
+    pause_after_exec = config.PAUSE_AFTER_EXEC and sys.stdin.isatty() # Never pause when instructions are piped in
+    dumps = _dumps
+
     browser_agent = None
+    plan_cache = None
+    plan_history = None
+    speculator = None
+    prepare_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
     try:
-        browser_agent = BrowserAgent()
-        previous_actions_history = [] # For potential context in future LLM calls
+        # Launch the browser, open the LLM connection and load the plan cache (which may load an embedding
+        # model) at the same time. Selenium talks to the browser over HTTP, so the agent can be created on a
+        # worker thread and driven from this one.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as startup:
+            browser_future = startup.submit(BrowserAgent)
+            warmup_future = startup.submit(generate_plan_from_instruction, "ping", warmup=True)
+            cache_future = startup.submit(PlanCache) if config.PLAN_CACHE_ENABLED else None
+            try:
+                browser_agent = browser_future.result()
+            finally: # Bound even if the browser failed, so the finally below closes it
+                plan_cache = cache_future.result() if cache_future else None
+            warmup_future.result()
+        plan_history = PlanHistory() # Last successful plan per exact instruction
+        speculator = SpeculativePlanner(generate_plan_from_instruction) if config.SPECULATIVE_PLANNING else None
+        last_instruction = None
+        input_reader = _InputReader()
 
         while True:
-            instruction = input("\nEnter your instruction (or type 'exit' to quit, 'clear' to reset history):\n> ")
+            try:
+                instruction = input_reader.read("\nEnter your instruction (several separated by ';;', 'exit' to quit, 'clear' to reset history):\n> ",
+                                                on_idle=speculator.drain if speculator else None)
+            except EOFError: # End of piped input
+                break
             if not instruction.strip():
                 continue
             if instruction.lower() == 'exit':
                 break
             if instruction.lower() == 'clear':
-                previous_actions_history = []
+                plan_history.clear()
+                if plan_cache:
+                    plan_cache.clear()
+                if speculator:
+                    speculator.clear()
+                last_instruction = None
                 browser_agent.extracted_data = {} # Clear extracted data as well
-                print("History and extracted data cleared.")
+                console.info("History, plan cache and extracted data cleared.")
                 continue
 
-            print("\n🤖 Thinking... Asking LLM to generate a plan...")
-            # For more advanced scenarios, you could pass previous_actions_history and error_context
-            plan = generate_plan_from_instruction(instruction)
-
-            print("\n📄 Received Plan from LLM:")
-            if not plan or not isinstance(plan, list) or not plan[0].get("action"):
-                print("Invalid or empty plan received from LLM. Please try rephrasing.")
+            if ";;" in instruction:
+                instructions = [part.strip() for part in instruction.split(";;") if part.strip()]
+                if instructions:
+                    run_instruction_batch(browser_agent, instructions, plan_history, plan_cache, max_steps)
                 continue
 
-            print(json.dumps(plan, indent=2))
+            if speculator:
+                speculator.record(last_instruction, instruction)
+            last_instruction = instruction
 
-            if plan[0].get("action") == "error":
-                print(f"Cannot execute plan due to LLM error: {plan[0].get('message')}")
+            context_keys = tuple(browser_agent.extracted_data) # Cached plans only apply in the same context
+            plan = plan_history.get(instruction, context_keys)
+            cached_plan = None # Plan served by plan_cache, evicted again if it fails
+            if plan:
+                console.info("\n♻ Using cached plan:")
+            elif plan_cache and (plan := plan_cache.lookup(instruction, context_keys)):
+                cached_plan = plan
+                console.info("\n♻ Using cached plan from a similar instruction:")
+            elif speculator and (plan := speculator.take(instruction, context_keys)):
+                console.info("\n⚡ Using plan prepared in the background:")
+            streamed = False # True once the exact plan has been shown while it was generated
+            if not plan and verbose_plan_print and console.isEnabledFor(logging.INFO): # Not with --quiet
+                console.info("\n📄 Plan from LLM:")
+                printer = _StreamPrinter("🤖 Thinking... Asking LLM to generate a plan...")
+                try:
+                    plan = generate_plan_from_instruction(instruction, on_token=printer, on_retry=printer.retry)
+                finally:
+                    printer.stop()
+                streamed = printer.received_tokens and not printer.retried
+                if printer.received_tokens:
+                    console.info("")
+            elif not plan:
+                console.info("\n🤖 Thinking... Asking LLM to generate a plan...")
+                plan = generate_plan_from_instruction(instruction)
+            checked_plan = _checked_plan(plan, max_steps)
+            if checked_plan is None:
                 continue
-            
-            if len(plan) > config.MAX_STEPS_PER_PLAN:
-                print(f"Warning: Plan exceeds maximum configured steps ({config.MAX_STEPS_PER_PLAN}).")
-                confirm_long_plan = input("Continue with this long plan? (yes/no): ").lower()
-                if confirm_long_plan not in ['yes', 'y']:
-                    print("Plan aborted by user due to length.")
-                    continue
+            if checked_plan is not plan:
+                streamed = False # Truncated: show what will actually run
+            plan = checked_plan
 
+            if verbose_plan_print and not streamed: # A plan streamed in a single attempt was already shown
+                with buffered_output():
+                    console.info(dumps(plan))
 
-            confirm = input("Do you want to execute this plan? (yes/no): ").lower()
-            if confirm == 'yes' or confirm == 'y':
-                print("\n🚀 Executing plan...")
-                success, error_message = browser_agent.execute_plan(plan, instruction)
+            # Validate (and pre-load the first page) while the user reads the plan
+            prepare_future = prepare_executor.submit(browser_agent.prepare_plan, plan, prefetch_first_page)
+            if _confirm("Do you want to execute this plan?"):
+                try:
+                    remaining_steps = prepare_future.result()
+                except ValueError as e:
+                    console.error(f"❌ Invalid plan: {e}")
+                    continue
+                except Exception as e:
+                    console.warning(f"Warning: Could not pre-load the plan, running it from the start. Details: {e}")
+                    remaining_steps = plan
+                console.info("\n🚀 Executing plan...")
+                success, error_message = browser_agent.execute_plan(remaining_steps, instruction)
+                if not success and cached_plan is not None:
+                    plan_cache.evict(cached_plan) # Don't serve a plan that no longer works
+                if not success:
+                    # Re-plan once with the strong model, telling it what went wrong
+                    console.warning(f"⚠️ Plan failed ({error_message}). Re-planning with the stronger model...")
+                    # error_message already names the failed step and its params
+                    retry_plan = _checked_plan(generate_plan_from_instruction(instruction, error_context=error_message, tier="strong"), max_steps)
+                    if retry_plan:
+                        if verbose_plan_print:
+                            with buffered_output():
+                                console.info(dumps(retry_plan))
+                        if _confirm("Execute the revised plan?"):
+                            plan = retry_plan
+                            success, error_message = browser_agent.execute_plan(plan, instruction)
                 if success:
-                    print("✅ Plan executed successfully.")
-                    previous_actions_history.extend(plan) # Add successful plan to history
+                    with buffered_output():
+                        console.info("✅ Plan executed successfully.")
+                        for name, value in browser_agent.extracted_data.items():
+                            console.info(f"   {name}: {str(value)[:100]}") # Step traces are only logged at INFO now
+                    plan_history.put(instruction, plan, context_keys) # Repeats of this instruction skip the LLM
+                    if speculator:
+                        speculator.speculate(instruction, browser_agent.extracted_data.keys()) # Plan likely follow-ups while the user reads/types
+                    if plan_cache:
+                        plan_cache.put(instruction, plan, context_keys)
                 else:
-                    print(f"❌ Plan execution failed. Error: {error_message}")
+                    console.error(f"❌ Plan execution failed. Error: {error_message}")
                     # Advanced: Offer to retry, or send error to LLM for re-planning
-                    # For now, we just report. If an error occurred, the partially executed
-                    # plan might still be added to history, or you might choose not to.
-                    # For simplicity, we add it to show what was attempted.
-                    previous_actions_history.extend(plan)
+                    # Failed plans are not remembered, so the next attempt asks the LLM again.
 
 
                 # print("\n🔄 Current extracted data:", browser_agent.extracted_data)
-                # print(f"📜 Actions history length: {len(previous_actions_history)}")
-                input("Execution finished. Press Enter to continue...")
+                if pause_after_exec:
+                    input("Execution finished. Press Enter to continue...")
             else:
-                print("Plan aborted by user.")
+                if not prepare_future.cancel():
+                    concurrent.futures.wait([prepare_future]) # Don't let a running pre-load overlap the next plan
+                console.info("Plan aborted by user.")
 
     except Exception as e:
-        print(f"\nAn critical error occurred in the main loop: {e}")
-        import traceback
+        console.error(f"\nAn critical error occurred in the main loop: {e}")
         traceback.print_exc()
     finally:
+        prepare_executor.shutdown(wait=True, cancel_futures=True)
         if browser_agent:
             browser_agent.close_browser()
-        print("\nWeb Automation Agent shut down. Goodbye! 👋")
+        if plan_cache:
+            plan_cache.close()
+        if speculator:
+            speculator.close()
+        if plan_history:
+            plan_history.save()
+        if _event_loop is not None:
+            _event_loop.close()
+        console.info("\nWeb Automation Agent shut down. Goodbye! 👋")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
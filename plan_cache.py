@@ -0,0 +1,352 @@
+# plan_cache.py
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import time
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+try:
+    import orjson # Optional: faster (de)serialization of the plan history
+except ImportError:
+    orjson = None
+try:
+    import zstandard # Optional: compresses the plan history file
+except ImportError:
+    zstandard = None
+try:
+    from blake3 import blake3 as _hasher # Optional: faster hashing
+except ImportError:
+    def _hasher(data: bytes):
+        return hashlib.blake2b(data, digest_size=32)
+
+import config
+
+logger = logging.getLogger(__name__)
+
+Embedder = Callable[[str], List[float]]
+
+def _normalize_instruction(instruction: str) -> str:
+    return " ".join(instruction.lower().split())
+
+def _fingerprint(instruction: str, context_keys: Iterable[str] = ()) -> str:
+    """
+    Hash of an instruction together with the names of the variables extracted so far. A plan is
+    only reused in the same context it was made in, e.g. not once a variable it relies on is gone.
+    """
+    return _hasher(f"{instruction}|{','.join(sorted(context_keys))}".encode()).hexdigest()
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def _encode(data) -> bytes:
+    """ Serializes with orjson (falling back to json) and compresses with zstandard level 3 if installed. """
+    raw = orjson.dumps(data) if orjson is not None else json.dumps(data).encode()
+    return zstandard.ZstdCompressor(level=3).compress(raw) if zstandard is not None else raw
+
+def _decode(blob: bytes):
+    if blob.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError("file is zstd-compressed but the zstandard package is not installed")
+        try:
+            blob = zstandard.ZstdDecompressor().decompress(blob)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"corrupt zstd data: {e}") from e
+    return orjson.loads(blob) if orjson is not None else json.loads(blob)
+
+_WORD_RE = re.compile(r"\w+")
+_SCHEMA_KEYS = ("action", "selector_type") # Step keys whose values come from the plan format, not the instruction
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall(text.lower()))
+
+def _literal_words(plan: List[Dict]) -> set:
+    """
+    Words of every literal value in a plan: texts, URLs, selectors, variable names, questions,
+    directions and numbers (e.g. seconds, pixels), including those inside batches and form fields.
+    """
+    words = set()
+    for step in plan:
+        if not isinstance(step, dict):
+            continue
+        for name, value in step.items():
+            if name in _SCHEMA_KEYS or isinstance(value, bool):
+                continue
+            if isinstance(value, list):
+                words |= _literal_words(value)
+            elif isinstance(value, (str, int, float)):
+                words |= _words(str(value))
+    return words
+
+def _literals_carry_over(plan: List[Dict], cached_instruction: str, instruction: str) -> bool:
+    """
+    True if every literal the plan took from its own instruction (e.g. the search text "cats" of
+    "search youtube for cats", or the 300 of "scroll down 300 pixels") also appears in the new
+    instruction, and the new instruction has no numbers the cached one lacked. Similar instructions
+    that only differ in such values ("... for dogs", "... 900 pixels") must not reuse the plan.
+    """
+    cached_words, words = _words(cached_instruction), _words(instruction)
+    if {word for word in words - cached_words if word.isdigit()}:
+        return False
+    return _literal_words(plan) & cached_words <= words
+
+def _unit(vector: List[float]) -> array:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return array("f", (x / norm for x in vector))
+
+def _default_embedder() -> Optional[Embedder]:
+    """
+    Picks an embedding backend: a local sentence-transformers model if installed, otherwise
+    Gemini's embedding API if a Google key is set. Returns None if neither is available.
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(config.PLAN_CACHE_EMBEDDING_MODEL)
+        return lambda text: model.encode(text).tolist()
+    except ImportError:
+        pass
+    except Exception as e: # Installed, but the model could not be loaded (e.g. offline and not downloaded yet)
+        logger.warning(f"Plan cache: could not load {config.PLAN_CACHE_EMBEDDING_MODEL}, trying the next embedding backend. Error: {e}")
+    if config.GOOGLE_API_KEY:
+        try:
+            import google.generativeai as genai
+            genai.configure(api_key=config.GOOGLE_API_KEY)
+        except Exception as e:
+            logger.warning(f"Plan cache: Gemini embeddings unavailable, using exact matching only. Error: {e}")
+            return None
+        return lambda text: genai.embed_content(model=config.GEMINI_EMBEDDING_MODEL, content=text)["embedding"]
+    return None
+
+
+class PlanCache:
+    """
+    On-disk cache of plans that executed successfully, looked up by instruction similarity.
+    Without an embedding backend it still serves exact (case/whitespace-insensitive) repeats.
+    """
+
+    def __init__(self, path: str = config.PLAN_CACHE_PATH, embedder: Optional[Embedder] = None):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS plans ("
+            "instruction TEXT PRIMARY KEY, embedding BLOB, plan TEXT NOT NULL, success_count INTEGER NOT NULL DEFAULT 0, "
+            "fingerprint TEXT)"
+        )
+        if "fingerprint" not in {row[1] for row in self._conn.execute("PRAGMA table_info(plans)")}:
+            self._conn.execute("ALTER TABLE plans ADD COLUMN fingerprint TEXT") # Cache file from an older version
+        self._conn.commit()
+        self._embed = embedder if embedder is not None else _default_embedder()
+        # In-memory index of (instruction, unit embedding); brute-force cosine is plenty for a personal cache
+        self._index: List[Tuple[str, array]] = []
+        for instruction, blob in self._conn.execute("SELECT instruction, embedding FROM plans WHERE embedding IS NOT NULL"):
+            vector = array("f")
+            vector.frombytes(blob)
+            self._index.append((instruction, vector))
+
+    def _embedding(self, instruction: str) -> Optional[array]:
+        if self._embed is None:
+            return None
+        try:
+            return _unit(self._embed(instruction))
+        except Exception as e:
+            logger.warning(f"Plan cache: embedding failed, using exact matching only. Error: {e}")
+            return None
+
+    def _load(self, key: str, context_keys: Iterable[str]) -> Optional[List[Dict]]:
+        row = self._conn.execute("SELECT plan, fingerprint FROM plans WHERE instruction = ?", (key,)).fetchone()
+        if row is None or row[1] != _fingerprint(key, context_keys):
+            return None
+        return json.loads(row[0])
+
+    def lookup(self, instruction: str, context_keys: Iterable[str] = (),
+               threshold: float = config.PLAN_CACHE_THRESHOLD) -> Optional[List[Dict]]:
+        """
+        Returns the cached plan of the most similar instruction with cosine similarity >= threshold,
+        provided it was stored with the same context (names of the extracted variables) and the literal
+        values it types or visits also occur in this instruction.
+        """
+        context_keys = tuple(context_keys)
+        key = _normalize_instruction(instruction)
+        plan = self._load(key, context_keys)
+        if plan is not None or not self._index:
+            return plan
+        query = self._embedding(key)
+        if query is None:
+            return None
+        best_key, best_score = None, threshold
+        for cached_key, vector in self._index:
+            if len(vector) != len(query):
+                continue # Stored with a different embedding model
+            score = sum(a * b for a, b in zip(query, vector))
+            if score >= best_score:
+                best_key, best_score = cached_key, score
+        if best_key is None:
+            return None
+        plan = self._load(best_key, context_keys)
+        if plan is None or not _literals_carry_over(plan, best_key, key):
+            return None
+        return plan
+
+    def put(self, instruction: str, plan: List[Dict], context_keys: Iterable[str] = ()):
+        """
+        Stores (or refreshes) the plan for an instruction, made with the given extracted variable names.
+        Call only after the plan succeeded.
+        """
+        key = _normalize_instruction(instruction)
+        known = any(cached_key == key for cached_key, _ in self._index)
+        vector = None if known else self._embedding(key)
+        self._conn.execute(
+            "INSERT INTO plans (instruction, embedding, plan, success_count, fingerprint) VALUES (?, ?, ?, 1, ?) "
+            "ON CONFLICT(instruction) DO UPDATE SET plan = excluded.plan, success_count = success_count + 1, "
+            "embedding = COALESCE(excluded.embedding, plans.embedding), fingerprint = excluded.fingerprint",
+            (key, vector.tobytes() if vector is not None else None, json.dumps(plan), _fingerprint(key, context_keys)),
+        )
+        self._conn.commit()
+        if vector is not None:
+            self._index.append((key, vector))
+
+    def evict(self, plan: List[Dict]):
+        """ Forgets every cached entry holding this plan, e.g. after a plan returned by lookup() failed. """
+        text = json.dumps(plan)
+        keys = {row[0] for row in self._conn.execute("SELECT instruction FROM plans WHERE plan = ?", (text,))}
+        if not keys:
+            return
+        self._conn.execute("DELETE FROM plans WHERE plan = ?", (text,))
+        self._conn.commit()
+        self._index = [(key, vector) for key, vector in self._index if key not in keys]
+
+    def clear(self):
+        self._conn.execute("DELETE FROM plans")
+        self._conn.commit()
+        self._index.clear()
+
+    def close(self):
+        self._conn.close()
+
+
+class PlanHistory:
+    """
+    Exact-match LRU of the last successful plan per instruction (case and surrounding
+    whitespace ignored) and context, saved to a (zstd-compressed) JSON file so repeats are free across
+    sessions too.
+    """
+
+    def __init__(self, path: str = config.PLAN_HISTORY_PATH, max_entries: int = config.PLAN_HISTORY_SIZE):
+        self._path = os.path.expanduser(path)
+        self._max_entries = max_entries
+        self._plans: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        try:
+            with open(self._path, "rb") as f:
+                for key, plan in _decode(f.read())["history"]:
+                    self._plans[key] = plan
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Plan history: could not load {self._path}, starting empty. Error: {e}")
+
+    @staticmethod
+    def _key(instruction: str, context_keys: Iterable[str]) -> str:
+        return _fingerprint(instruction.strip().lower(), context_keys)
+
+    def get(self, instruction: str, context_keys: Iterable[str] = ()) -> Optional[List[Dict]]:
+        key = self._key(instruction, context_keys)
+        plan = self._plans.get(key)
+        if plan is not None:
+            self._plans.move_to_end(key)
+        return plan
+
+    def put(self, instruction: str, plan: List[Dict], context_keys: Iterable[str] = ()):
+        key = self._key(instruction, context_keys)
+        self._plans[key] = plan
+        self._plans.move_to_end(key)
+        while len(self._plans) > self._max_entries:
+            self._plans.popitem(last=False)
+
+    def clear(self):
+        self._plans.clear()
+
+    def save(self):
+        try:
+            with open(self._path, "wb") as f:
+                f.write(_encode({"history": list(self._plans.items())}))
+        except OSError as e:
+            logger.warning(f"Plan history: could not save {self._path}. Error: {e}")
+
+
+class SpeculativePlanner:
+    """
+    Counts which instruction follows which (a 2-gram model over the session) and, after a turn,
+    plans the most likely follow-ups in the background. If the user then types one of them, the
+    plan is ready without waiting for the LLM. Speculative plans expire after ttl seconds and are
+    only used in the context (extracted variable names) they were planned in.
+    """
+
+    def __init__(self, plan_fn: Callable[[str], List[Dict]], top_k: int = config.SPECULATION_TOP_K,
+                 ttl: float = config.SPECULATION_TTL_SECONDS):
+        self._plan_fn = plan_fn
+        self._top_k = top_k
+        self._ttl = ttl
+        self._successors: Counter = Counter() # (previous, next) normalized instruction pairs
+        self._plans: Dict[str, Tuple[List[Dict], float, frozenset]] = {} # instruction -> (plan, expires_at, context_keys)
+        self._pending: Dict[str, Tuple[Future, frozenset]] = {} # instruction -> (plan still being generated, context_keys)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, top_k), thread_name_prefix="speculate")
+
+    def record(self, previous: Optional[str], current: str):
+        if previous:
+            self._successors[(_normalize_instruction(previous), _normalize_instruction(current))] += 1
+
+    def _predict(self, instruction: str) -> List[str]:
+        key = _normalize_instruction(instruction)
+        candidates = [(count, nxt) for (prev, nxt), count in self._successors.items() if prev == key]
+        return [nxt for _, nxt in sorted(candidates, reverse=True)[:self._top_k]]
+
+    def _store(self, prediction: str, future: Future, context_keys: frozenset):
+        try:
+            plan = future.result()
+        except Exception as e:
+            logger.debug(f"Speculative planning of '{prediction}' failed: {e}")
+            return # Speculation is best effort; the user's real request will plan it again
+        if plan and plan[0].get("action") != "error":
+            self._plans[prediction] = (plan, time.monotonic() + self._ttl, context_keys)
+
+    def speculate(self, instruction: str, context_keys: Iterable[str] = ()):
+        """ Starts planning the likely next instructions in the background, for the given extracted variable names. """
+        context_keys = frozenset(context_keys)
+        for prediction in self._predict(instruction):
+            if prediction not in self._plans and prediction not in self._pending:
+                self._pending[prediction] = (self._executor.submit(self._plan_fn, prediction), context_keys)
+
+    def drain(self):
+        """ Moves finished background plans into the ready store. Cheap enough to call between input polls. """
+        for prediction, (future, context_keys) in list(self._pending.items()):
+            if future.done():
+                del self._pending[prediction]
+                self._store(prediction, future, context_keys)
+
+    def take(self, instruction: str, context_keys: Iterable[str] = ()) -> Optional[List[Dict]]:
+        """
+        Returns (and forgets) a still-valid speculative plan for this instruction, if it was planned
+        in the same context. If that plan is still being generated, waits for it: it started before
+        the user finished typing.
+        """
+        key = _normalize_instruction(instruction)
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            self._store(key, *pending)
+        entry = self._plans.pop(key, None)
+        if entry and entry[1] > time.monotonic() and entry[2] == frozenset(context_keys):
+            return entry[0]
+        return None
+
+    def clear(self):
+        for future, _ in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._plans.clear()
+        self._successors.clear()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)